@@ -8,9 +8,6 @@ import requests
 from typing import List, Dict, Any, Optional
 import asyncio
 from pathlib import Path
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
 # --- Agno Kütüphaneleri ---
 from agno.agent import Agent
@@ -19,6 +16,10 @@ from agno.models.google import Gemini
 # --- MCP Tools for database access ---
 from agno.tools.mcp import MCPTools
 
+from app.tag_vectors import tag_match_scores
+from app.text_normalization import canonical_tag
+from app.async_database import run_in_db_executor
+
 # --- Proje Konfigürasyonu ---
 OUTPUT_DIR = Path(__file__).parent / "output"
 OUTPUT_DIR.mkdir(exist_ok=True)
@@ -30,10 +31,20 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MCP_SERVER_COMMAND = "fastmcp run mcp_server.py"
 
+def _similarity_ranking_key(product: Dict[str, Any]) -> tuple:
+    """Skor (büyükten küçüğe), eşitlikte yorum sayısı, puan ve id; catalog aramasıyla aynı sıra"""
+    return (
+        -product['similarity_score'],
+        -(product.get('review_count') or 0),
+        -(product.get('rating') or 0.0),
+        str(product.get('id', '')),
+    )
+
 def cosine_similarity_search(search_tags: List[str], product_data: List[Dict[str, Any]], min_threshold: float = 0.1) -> List[Dict[str, Any]]:
     """
     Search for products using cosine similarity between search tags and product tags.
-    This enables finding products even when tag order is different (e.g., 'bluetooth_kulaklık' matches 'kulaklık_bluetooth').
+    Tags are compared in canonical form, so 'bluetooth_kulaklık' matches 'kulaklık_bluetooth' exactly;
+    only tags unknown to the catalog are scored with the pre-fitted TF-IDF model (see app.tag_vectors).
     
     Args:
         search_tags: List of tags to search for
@@ -47,63 +58,22 @@ def cosine_similarity_search(search_tags: List[str], product_data: List[Dict[str
         return []
     
     try:
-        # Prepare text data for vectorization
-        search_text = ' '.join(search_tags)
-        product_texts = []
-        
-        for product in product_data:
-            product_tags = product.get('tags', [])
-            if isinstance(product_tags, str):
-                product_tags = json.loads(product_tags) if product_tags else []
-            product_text = ' '.join(product_tags) if product_tags else ''
-            product_texts.append(product_text)
-        
-        # Only proceed if we have product texts
-        if not any(product_texts):
-            return []
-        
-        # Combine search text with product texts for vectorization
-        all_texts = [search_text] + product_texts
-        
-        # Use character n-grams to catch partial matches like bluetooth_kulaklık vs kulaklık_bluetooth
-        vectorizer = TfidfVectorizer(
-            analyzer='char_wb',  # Character-based with word boundaries
-            ngram_range=(3, 8),  # N-gram range for character analysis
-            lowercase=True,
-            max_features=10000,
-            min_df=1  # Include terms that appear in at least 1 document
-        )
-        
-        tfidf_matrix = vectorizer.fit_transform(all_texts)
-        
-        # Calculate cosine similarity between search query (first vector) and all products
-        search_vector = tfidf_matrix[0]
-        product_vectors = tfidf_matrix[1:]
-        
-        similarities = cosine_similarity(search_vector, product_vectors).flatten()
+        # Exact canonical tag matches by hash lookup, TF-IDF only for leftover tags
+        similarities = tag_match_scores(search_tags, product_data)
         
         # Create results with similarity scores
         results = []
         for i, product in enumerate(product_data):
             similarity_score = similarities[i]
             
-            # Boost score for exact tag matches
-            product_tags = product.get('tags', [])
-            if isinstance(product_tags, str):
-                product_tags = json.loads(product_tags) if product_tags else []
-            
-            exact_matches = set(search_tags) & set(product_tags)
-            if exact_matches:
-                similarity_score *= (1.0 + len(exact_matches) * 0.3)
-            
             # Apply minimum threshold
             if similarity_score > min_threshold:
                 product_with_score = product.copy()
                 product_with_score['similarity_score'] = float(similarity_score)
                 results.append(product_with_score)
         
-        # Sort by similarity score
-        results.sort(key=lambda x: x['similarity_score'], reverse=True)
+        # Sort by similarity score (ties: same order as the catalog search)
+        results.sort(key=_similarity_ranking_key)
         return results
         
     except Exception as e:
@@ -115,7 +85,7 @@ def cosine_similarity_search(search_tags: List[str], product_data: List[Dict[str
             if isinstance(product_tags, str):
                 product_tags = json.loads(product_tags) if product_tags else []
             
-            matching_tags = set(search_tags) & set(product_tags)
+            matching_tags = {canonical_tag(tag) for tag in search_tags} & {canonical_tag(tag) for tag in product_tags}
             similarity_score = len(matching_tags) / max(len(search_tags), 1)
             
             if similarity_score > min_threshold:
@@ -123,7 +93,7 @@ def cosine_similarity_search(search_tags: List[str], product_data: List[Dict[str
                 product_with_score['similarity_score'] = similarity_score
                 results.append(product_with_score)
         
-        results.sort(key=lambda x: x['similarity_score'], reverse=True)
+        results.sort(key=_similarity_ranking_key)
         return results
 
 def _create_tag_generator_agent() -> Agent:
@@ -312,33 +282,59 @@ async def search_ecommerce_products_via_mcp_agent(tags: List[str], limit: int =
         print(f"   🔄 Falling back to direct database search...")
         return await search_ecommerce_products_fallback(tags, limit)
 
+def _ecommerce_product_to_dict(product) -> dict:
+    """EcommerceProduct -> agent'ın kullandığı dict formatı (image_base64 dahil)"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'currency': product.currency,
+        'image_url': product.image_url,
+        'image_base64': getattr(product, 'image_base64', None),
+        'visual_representation': getattr(product, 'visual_representation', None),
+        'tags': product.tags,
+        'category': product.category,
+        'subcategory': product.subcategory,
+        'brand': product.brand,
+        'stock': product.stock,
+        'rating': product.rating,
+        'review_count': product.review_count
+    }
+
+async def route_search_categories(tags: List[str]) -> Optional[List[str]]:
+    """Tag'lerin ait olduğu kategoriler (category router); güven düşükse None = tüm catalog"""
+    try:
+        from app.category_router import route_categories
+        categories = await run_in_db_executor(route_categories, tags)
+        if categories:
+            print(f"   🧭 Routed to categories: {categories}")
+        return categories
+    except Exception as e:
+        print(f"   ⚠️ Category routing failed: {e}")
+        return None
+
+async def search_ecommerce_products_via_ann(tags: List[str], limit: int = 8,
+                                            categories: Optional[List[str]] = None) -> List[dict]:
+    """Local ANN index üzerinden aday ürünler (LLM/MCP round-trip'i olmadan)"""
+    try:
+        from app.async_database import search_products_by_vector_async
+        products = await search_products_by_vector_async(search_tags=tags, limit=limit, categories=categories)
+        products_dict = [_ecommerce_product_to_dict(product) for product in products]
+        print(f"   🧭 ANN index returned {len(products_dict)} candidates")
+        return products_dict
+    except Exception as e:
+        print(f"   ⚠️ ANN candidate search failed: {e}")
+        return []
+
 async def search_ecommerce_products_fallback(tags: List[str], limit: int = 8) -> List[dict]:
     """Fallback: Direct database search without MCP"""
     try:
-        from app.database import search_products_by_tags
-        products = search_products_by_tags(search_tags=tags, limit=limit)
+        from app.async_database import search_products_by_tags_async
+        products = await search_products_by_tags_async(search_tags=tags, limit=limit)
         
         # Convert to dict format including image_base64
-        products_dict = []
-        for product in products:
-            product_dict = {
-                'id': product.id,
-                'name': product.name,
-                'description': product.description,
-                'price': product.price,
-                'currency': product.currency,
-                'image_url': product.image_url,
-                'image_base64': getattr(product, 'image_base64', None),
-                'visual_representation': getattr(product, 'visual_representation', None),
-                'tags': product.tags,
-                'category': product.category,
-                'subcategory': product.subcategory,
-                'brand': product.brand,
-                'stock': product.stock,
-                'rating': product.rating,
-                'review_count': product.review_count
-            }
-            products_dict.append(product_dict)
+        products_dict = [_ecommerce_product_to_dict(product) for product in products]
         
         print(f"   🔄 Fallback search returned {len(products_dict)} products")
         return products_dict
@@ -347,14 +343,49 @@ async def search_ecommerce_products_fallback(tags: List[str], limit: int = 8) ->
         print(f"   ❌ Fallback also failed: {fallback_error}")
         return []
 
-# Main search function that tries MCP first, then fallback, then applies cosine similarity
+def _heuristic_fallback_tags(product: Dict[str, Any], visual_description: str) -> List[str]:
+    """Ürün adı / açıklamasındaki anahtar kelimelerden kategoriye özel yedek tag'ler"""
+    product_name = product.get('urun_adi', '').lower()
+    product_desc = product.get('urun_aciklama', '').lower()
+    visual_desc = visual_description.lower()
+    
+    # Extract category-specific tags based on product content
+    all_text = f"{product_name} {product_desc} {visual_desc}"
+    
+    # Electronics & Tech keywords
+    if any(keyword in all_text for keyword in ['kulaklık', 'headphone', 'bluetooth', 'kablosuz', 'ses', 'audio', 'musik', 'oyun', 'gaming']):
+        return ['bluetooth_kulaklik', 'kablosuz_kulaklik', 'ses_cihazi', 'elektronik']
+    # Furniture keywords  
+    if any(keyword in all_text for keyword in ['sehpa', 'masa', 'sandalye', 'dolap', 'mobilya', 'ahşap', 'koltuk']):
+        return ['mobilya', 'ev_dekorasyonu', 'ahsap_mobilya', 'modern_mobilya']
+    # Kitchen keywords
+    if any(keyword in all_text for keyword in ['mutfak', 'kitchen', 'ocak', 'buzdolabı', 'fırın', 'blender']):
+        return ['mutfak_gereci', 'ev_aletleri', 'yemek_hazırlık']
+    # Bathroom keywords
+    if any(keyword in all_text for keyword in ['banyo', 'bathroom', 'duş', 'lavabo', 'tuvalet', 'hijyen']):
+        return ['banyo_aksesuari', 'hijyen_urunleri', 'ev_gerecleri']
+    # Default fallback
+    return ['genel_urun', 'ev_gerecleri', 'gunluk_kullanim']
+
+# Main search function: ANN candidates first, then MCP, then fallback, then applies cosine similarity
 async def search_ecommerce_products_async(tags: List[str], limit: int = 8) -> List[dict]:
-    """Main search function: MCP first, fallback second, cosine similarity filtering"""
+    """Main search function: ANN candidates first, MCP/fallback if too few, cosine similarity filtering"""
     try:
-        print(f"🔍 [STEP 1] Getting all products from MCP...")
+        print(f"🔍 [STEP 1] Getting candidate products from ANN index...")
         # İlk önce daha fazla ürün iste (cosine similarity filtreleme için) - limit reasonable olarak ayarla
         search_limit = min(100, limit * 5)  # Mak 100 ürün iste, küçük DB için yeterli
-        all_products = await search_ecommerce_products_via_mcp_agent(tags, limit=search_limit)
+        categories = await route_search_categories(tags)
+        all_products = await search_ecommerce_products_via_ann(tags, limit=search_limit, categories=categories)
+        
+        if categories and len(all_products) < limit:
+            print(f"   🔄 Too few products in {categories}, searching the whole catalog...")
+            all_products = await search_ecommerce_products_via_ann(tags, limit=search_limit)
+        
+        if len(all_products) < limit:
+            print(f"   🔄 Only {len(all_products)} ANN candidates, asking MCP...")
+            seen_ids = {product.get('id') for product in all_products}
+            mcp_products = await search_ecommerce_products_via_mcp_agent(tags, limit=search_limit)
+            all_products += [product for product in mcp_products if product.get('id') not in seen_ids]
         
         if not all_products:
             print(f"   🔄 No products from MCP, trying fallback...")
@@ -367,8 +398,9 @@ async def search_ecommerce_products_async(tags: List[str], limit: int = 8) -> Li
         print(f"🔍 [STEP 2] Applying cosine similarity filtering...")
         print(f"   📊 Input: {len(all_products)} products, target: {limit} products")
         
-        # Cosine similarity tool'unu kullan
-        similarity_results = cosine_similarity_search(
+        # Cosine similarity tool'unu kullan (catalog/model erişimi event loop dışında)
+        similarity_results = await run_in_db_executor(
+            cosine_similarity_search,
             search_tags=tags,
             product_data=all_products,
             min_threshold=0.05  # Düşük threshold ile daha fazla ürün dahil et
@@ -620,30 +652,7 @@ async def run_simple_tag_generation(product: Dict[str, Any], visual_description:
         print("🔄 Using fallback response...")
         
         # Smart Fallback: Extract meaningful tags from product name/description
-        fallback_tags = []
-        product_name = product.get('urun_adi', '').lower()
-        product_desc = product.get('urun_aciklama', '').lower()
-        visual_desc = visual_description.lower()
-        
-        # Extract category-specific tags based on product content
-        all_text = f"{product_name} {product_desc} {visual_desc}"
-        
-        # Electronics & Tech keywords
-        if any(keyword in all_text for keyword in ['kulaklık', 'headphone', 'bluetooth', 'kablosuz', 'ses', 'audio', 'musik', 'oyun', 'gaming']):
-            fallback_tags = ['bluetooth_kulaklik', 'kablosuz_kulaklik', 'ses_cihazi', 'elektronik']
-        # Furniture keywords  
-        elif any(keyword in all_text for keyword in ['sehpa', 'masa', 'sandalye', 'dolap', 'mobilya', 'ahşap', 'koltuk']):
-            fallback_tags = ['mobilya', 'ev_dekorasyonu', 'ahsap_mobilya', 'modern_mobilya']
-        # Kitchen keywords
-        elif any(keyword in all_text for keyword in ['mutfak', 'kitchen', 'ocak', 'buzdolabı', 'fırın', 'blender']):
-            fallback_tags = ['mutfak_gereci', 'ev_aletleri', 'yemek_hazırlık']
-        # Bathroom keywords
-        elif any(keyword in all_text for keyword in ['banyo', 'bathroom', 'duş', 'lavabo', 'tuvalet', 'hijyen']):
-            fallback_tags = ['banyo_aksesuari', 'hijyen_urunleri', 'ev_gerecleri']
-        # Default fallback
-        else:
-            fallback_tags = ['genel_urun', 'ev_gerecleri', 'gunluk_kullanim']
-            
+        fallback_tags = _heuristic_fallback_tags(product, visual_description)
         print(f"🎯 Smart fallback tags generated: {fallback_tags}")
         fallback_products = await search_ecommerce_products_async(fallback_tags)
         
@@ -730,8 +739,8 @@ async def generate_ab_test_suggestion(product_id: str, current_text: str, test_f
         # Get product data and common queries from database
         print("\n🔍 [STEP 1] Getting product data from database...")
         
-        from app.database import get_ecommerce_product_by_id
-        product_data = get_ecommerce_product_by_id(product_id)
+        from app.async_database import get_ecommerce_product_by_id_async
+        product_data = await get_ecommerce_product_by_id_async(product_id)
         
         if not product_data:
             print(f"⚠️ Product with ID {product_id} not found in database")
@@ -755,8 +764,8 @@ async def generate_ab_test_suggestion(product_id: str, current_text: str, test_f
         # Get all common queries from similar products in the same category
         print("\n🔍 [STEP 2] Getting common queries from similar products...")
         
-        from app.database import get_common_queries_by_category
-        category_queries = get_common_queries_by_category(product_data.get('category', ''))
+        from app.async_database import get_common_queries_by_category_async
+        category_queries = await get_common_queries_by_category_async(product_data.get('category', ''))
         
         print(f"📂 Found {len(category_queries)} queries from category '{product_data.get('category', '')}'")
         
@@ -0,0 +1,263 @@
+"""
+Approximate nearest-neighbour index over catalog products (no external service).
+Products are embedded as hashed character n-gram vectors of their tags, name and
+description. Random-projection LSH (SimHash) tables map them to buckets, and a query
+only re-ranks the products in its buckets exactly instead of scanning the whole catalog.
+
+Build it offline with `python -m app.ann_index`; otherwise it is built on first use
+and persisted to disk. Recall/latency is tuned at query time with `probes` (neighbouring
+buckets visited per table) and `max_candidates`.
+"""
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from app.catalog import CatalogSnapshot
+from app.database import get_catalog_snapshot
+from app.text_normalization import fold_turkish
+
+INDEX_PATH = Path(__file__).parent / "output" / "ann_index.joblib"
+INDEX_PATH.parent.mkdir(exist_ok=True)
+
+# Build-time parameters (changing them requires a rebuild)
+ANN_NUM_FEATURES = 2 ** 14
+ANN_NUM_TABLES = int(os.getenv("ANN_NUM_TABLES", "12"))
+ANN_BUCKET_SIZE = int(os.getenv("ANN_BUCKET_SIZE", "8"))  # target products per bucket; sets bits per table
+ANN_SEED = 42
+
+# Query-time defaults: more probes / candidates = better recall, more latency
+ANN_PROBES = int(os.getenv("ANN_PROBES", "2"))
+ANN_MAX_CANDIDATES = int(os.getenv("ANN_MAX_CANDIDATES", "2000"))
+
+_vectorizer = HashingVectorizer(
+    analyzer='char_wb',
+    ngram_range=(3, 5),
+    n_features=ANN_NUM_FEATURES,
+    alternate_sign=False,
+    norm='l2',
+    lowercase=True
+)
+
+# Indexes by catalog fingerprint. The previous one is kept so that requests still holding the
+# old snapshot during a catalog swap neither rebuild nor rewrite the file on disk.
+INDEX_CACHE_SIZE = 2
+_indexes: "OrderedDict[str, AnnIndex]" = OrderedDict()
+# Snapshot -> index, so the O(N) fingerprint is computed once per snapshot, not per request
+_index_by_snapshot: "weakref.WeakKeyDictionary[CatalogSnapshot, AnnIndex]" = weakref.WeakKeyDictionary()
+_index_lock = threading.Lock()
+
+
+def product_text(entry) -> str:
+    """Ürünün vektörleştirilecek metni: tag'ler (iki kez, daha ağırlıklı) + isim + açıklama, Türkçe katlanmış"""
+    tag_text = ' '.join(tag.replace('_', ' ') for tag in entry.tags)
+    return fold_turkish(f"{tag_text} {tag_text} {entry.name} {entry.description}")
+
+
+def query_text(search_tags: List[str]) -> str:
+    return fold_turkish(' '.join(tag.replace('_', ' ') for tag in search_tags))
+
+
+def bits_for_catalog_size(product_count: int) -> int:
+    """Tablo başına bit sayısı: bucket başına ~ANN_BUCKET_SIZE ürün düşecek şekilde (4..20)"""
+    buckets = max(product_count / max(ANN_BUCKET_SIZE, 1), 1)
+    return int(min(max(np.ceil(np.log2(buckets)), 4), 20))
+
+
+def catalog_text_fingerprint(snapshot: CatalogSnapshot) -> str:
+    """İndekse giren içeriğin (id + metin) ve build parametrelerinin hash'i"""
+    digest = hashlib.sha1(f"{ANN_NUM_FEATURES}:{ANN_NUM_TABLES}:{ANN_BUCKET_SIZE}:{ANN_SEED}".encode('utf-8'))
+    for entry in sorted(snapshot.entries, key=lambda e: e.id):
+        digest.update(entry.id.encode('utf-8'))
+        digest.update(product_text(entry).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _random_planes(num_tables: int, num_bits: int) -> np.ndarray:
+    # Regenerated from the seed instead of being persisted
+    rng = np.random.default_rng(ANN_SEED)
+    return rng.standard_normal((ANN_NUM_FEATURES, num_tables * num_bits)).astype(np.float32)
+
+
+class AnnIndex:
+    """SimHash LSH tabloları + yeniden sıralama için ürün vektörleri"""
+
+    def __init__(self, product_ids: List[str], vectors: sparse.csr_matrix, num_tables: int, num_bits: int,
+                 table_codes: List[np.ndarray], table_positions: List[np.ndarray], fingerprint: str):
+        self.product_ids = product_ids
+        self.vectors = vectors
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        # Per table: bucket codes sorted ascending and the product positions in that order
+        self.table_codes = table_codes
+        self.table_positions = table_positions
+        self.fingerprint = fingerprint
+        self._planes = _random_planes(num_tables, num_bits)
+        self._bit_weights = (1 << np.arange(num_bits, dtype=np.int64))
+
+    def _projections(self, vectors: sparse.csr_matrix) -> np.ndarray:
+        """(n x tables x bits) projeksiyon değerleri"""
+        projected = np.asarray(vectors @ self._planes)
+        return projected.reshape(vectors.shape[0], self.num_tables, self.num_bits)
+
+    def _codes(self, projections: np.ndarray) -> np.ndarray:
+        return ((projections > 0).astype(np.int64) * self._bit_weights).sum(axis=-1)
+
+    def _probe_codes(self, projections: np.ndarray, probes: int) -> List[List[int]]:
+        """Her tablo için sorgunun bucket'ı + en belirsiz bitleri çevrilmiş komşu bucket'lar"""
+        codes = self._codes(projections)
+        probe_codes = []
+        for table in range(self.num_tables):
+            code = int(codes[table])
+            table_probes = [code]
+            # Bits closest to the hyperplane are the most likely to differ for true neighbours
+            uncertain_bits = np.argsort(np.abs(projections[table]))[:max(probes - 1, 0)]
+            table_probes.extend(code ^ (1 << int(bit)) for bit in uncertain_bits)
+            probe_codes.append(table_probes)
+        return probe_codes
+
+    def candidates(self, search_tags: List[str], probes: int = ANN_PROBES,
+                   max_candidates: int = ANN_MAX_CANDIDATES) -> np.ndarray:
+        """
+        Sorgu bucket'larındaki ürün pozisyonları, en fazla max_candidates.
+        Bucket'lar probe sırasıyla toplanır: önce tüm tablolarda sorgunun kendi bucket'ı,
+        sonra komşu bucket'lar; tekrarlar atlanır ve limit dolunca durulur.
+        """
+        query_vector = _vectorizer.transform([query_text(search_tags)])
+        projections = self._projections(query_vector)[0]
+        probe_codes = self._probe_codes(projections, probes)
+
+        seen = np.zeros(len(self.product_ids), dtype=bool)
+        found = []
+        total = 0
+        for rank in range(max(probes, 1)):
+            for table, table_probes in enumerate(probe_codes):
+                if rank >= len(table_probes):
+                    continue
+                codes = self.table_codes[table]
+                start = np.searchsorted(codes, table_probes[rank], side='left')
+                end = np.searchsorted(codes, table_probes[rank], side='right')
+                bucket = self.table_positions[table][start:end]
+                bucket = bucket[~seen[bucket]][:max_candidates - total]
+                if len(bucket) == 0:
+                    continue
+                seen[bucket] = True
+                found.append(bucket)
+                total += len(bucket)
+                if total >= max_candidates:
+                    return np.concatenate(found)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(found)
+
+    def search(self, search_tags: List[str], limit: int = 40, probes: int = ANN_PROBES,
+               max_candidates: int = ANN_MAX_CANDIDATES) -> List[Tuple[str, float]]:
+        """LSH adaylarını tam kosinüs ile yeniden sırala; (product_id, score) döndür"""
+        positions = self.candidates(search_tags, probes=probes, max_candidates=max_candidates)
+        if len(positions) == 0 or limit <= 0:
+            return []
+        query_vector = _vectorizer.transform([query_text(search_tags)])
+        scores = np.asarray((self.vectors[positions] @ query_vector.T).todense()).ravel()
+        order = np.argsort(-scores, kind='stable')[:limit]
+        return [(self.product_ids[positions[i]], float(scores[i])) for i in order if scores[i] > 0]
+
+
+def build_ann_index(snapshot: CatalogSnapshot) -> AnnIndex:
+    """Catalog'dan LSH indeksini oluştur"""
+    product_ids = [entry.id for entry in snapshot.entries]
+    vectors = _vectorizer.transform([product_text(entry) for entry in snapshot.entries]).tocsr()
+
+    num_bits = bits_for_catalog_size(len(product_ids))
+
+    index = AnnIndex(product_ids, vectors, ANN_NUM_TABLES, num_bits, [], [], catalog_text_fingerprint(snapshot))
+    codes = index._codes(index._projections(vectors)) if product_ids else np.empty((0, ANN_NUM_TABLES), dtype=np.int64)
+    for table in range(ANN_NUM_TABLES):
+        order = np.argsort(codes[:, table], kind='stable')
+        index.table_codes.append(codes[order, table])
+        index.table_positions.append(order)
+    print(f"🧭 Built ANN index over {len(product_ids)} products ({ANN_NUM_TABLES} tables x {num_bits} bits)")
+    return index
+
+
+def save_ann_index(index: AnnIndex, path: Path = INDEX_PATH):
+    """İndeksi diske yaz (önce geçici dosyaya, sonra atomik rename)"""
+    tmp_path = path.with_suffix('.tmp')
+    joblib.dump({
+        'product_ids': index.product_ids,
+        'vectors': index.vectors,
+        'num_tables': index.num_tables,
+        'num_bits': index.num_bits,
+        'table_codes': index.table_codes,
+        'table_positions': index.table_positions,
+        'fingerprint': index.fingerprint,
+    }, tmp_path)
+    tmp_path.replace(path)
+
+
+def load_ann_index(path: Path = INDEX_PATH) -> Optional[AnnIndex]:
+    """Diskteki indeksi yükle, yoksa veya okunamıyorsa None döndür"""
+    if not path.exists():
+        return None
+    try:
+        data = joblib.load(path)
+        return AnnIndex(data['product_ids'], data['vectors'], data['num_tables'], data['num_bits'],
+                        data['table_codes'], data['table_positions'], data['fingerprint'])
+    except Exception as e:
+        print(f"⚠️ Could not load ANN index from {path}: {e}")
+        return None
+
+
+def get_ann_index(snapshot: CatalogSnapshot = None) -> AnnIndex:
+    """
+    Verilen (varsayılan: güncel) catalog snapshot'ına ait indeksi döndür.
+    Bellekte yoksa diskteki indeks catalog ile eşleşiyorsa yüklenir, değilse yeniden
+    oluşturulup kaydedilir.
+    """
+    if snapshot is None:
+        snapshot = get_catalog_snapshot()
+    index = _index_by_snapshot.get(snapshot)
+    if index is not None:
+        return index
+
+    with _index_lock:
+        index = _index_by_snapshot.get(snapshot)
+        if index is not None:
+            return index
+
+        fingerprint = catalog_text_fingerprint(snapshot)
+        index = _indexes.get(fingerprint)
+        if index is None:
+            index = load_ann_index()
+            if index is not None and index.fingerprint == fingerprint:
+                print(f"🧭 Loaded ANN index for {len(index.product_ids)} products from disk")
+            else:
+                index = build_ann_index(snapshot)
+                try:
+                    save_ann_index(index)
+                except OSError as e:
+                    print(f"⚠️ Could not persist ANN index: {e}")
+
+        _indexes[fingerprint] = index
+        _indexes.move_to_end(fingerprint)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+        _index_by_snapshot[snapshot] = index
+        return index
+
+
+if __name__ == "__main__":
+    # Offline build: python -m app.ann_index
+    from app.database import migrate_databases
+
+    migrate_databases()
+    catalog = get_catalog_snapshot()
+    save_ann_index(build_ann_index(catalog))
+    print(f"💾 ANN index written to {INDEX_PATH}")
@@ -0,0 +1,87 @@
+"""
+Async data-access API for async routes and agent code.
+sqlite3 calls block, so they run on a dedicated, bounded thread pool instead of
+the event loop. Each worker thread reuses its own pooled connection (see
+app.database.get_connection).
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Callable, Any
+
+from app import database
+from app.models import EcommerceProduct
+
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_in_db_executor(func: Callable, *args, **kwargs) -> Any:
+    """Senkron bir veritabanı (veya catalog) fonksiyonunu DB thread pool'unda çalıştır"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+
+async def search_products_by_tags_async(search_tags: List[str], limit: int = 4, min_price: float = None,
+                                        max_price: float = None, category: str = None,
+                                        include_images: bool = True,
+                                        categories: Optional[List[str]] = None) -> List[EcommerceProduct]:
+    return await run_in_db_executor(
+        database.search_products_by_tags,
+        search_tags,
+        limit=limit,
+        min_price=min_price,
+        max_price=max_price,
+        category=category,
+        include_images=include_images,
+        categories=categories
+    )
+
+
+async def search_products_by_tags_batch_async(queries: List[List[str]], limit: int = 4, min_price: float = None,
+                                              max_price: float = None, category: str = None,
+                                              min_threshold: float = 0.1) -> List[List[EcommerceProduct]]:
+    return await run_in_db_executor(
+        database.search_products_by_tags_batch,
+        queries,
+        limit=limit,
+        min_price=min_price,
+        max_price=max_price,
+        category=category,
+        min_threshold=min_threshold
+    )
+
+
+async def search_products_by_vector_async(search_tags: List[str], limit: int = 40, probes: Optional[int] = None,
+                                          max_candidates: Optional[int] = None,
+                                          include_images: bool = True,
+                                          categories: Optional[List[str]] = None) -> List[EcommerceProduct]:
+    return await run_in_db_executor(
+        database.search_products_by_vector,
+        search_tags,
+        limit=limit,
+        probes=probes,
+        max_candidates=max_candidates,
+        include_images=include_images,
+        categories=categories
+    )
+
+
+async def find_products_by_common_query_async(text: str, limit: int = 4,
+                                              include_images: bool = True) -> List[EcommerceProduct]:
+    return await run_in_db_executor(
+        database.find_products_by_common_query,
+        text,
+        limit=limit,
+        include_images=include_images
+    )
+
+
+async def get_ecommerce_product_by_id_async(product_id: str) -> Optional[dict]:
+    return await run_in_db_executor(database.get_ecommerce_product_by_id, product_id)
+
+
+async def get_common_queries_by_category_async(category: str) -> List[str]:
+    return await run_in_db_executor(database.get_common_queries_by_category, category)
@@ -0,0 +1,184 @@
+"""
+Typeahead suggestions over the in-memory catalog.
+Product names, tags and common queries are folded (see app.text_normalization) and
+stored as a sorted key array; a prefix lookup is two bisects plus a top-k over the
+matching range, so a keystroke never touches SQLite or the LLM. Every word start of a
+phrase is indexed too, so 'kulak' also finds 'Pocket TWS Bluetooth Kulaklık'.
+The index is rebuilt per catalog snapshot: up front by the catalog sync (before the
+swap), otherwise in a background thread while the previous index keeps serving.
+"""
+import bisect
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.catalog import CatalogSnapshot
+from app.database import get_catalog_snapshot
+from app.text_normalization import search_tokens
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+# (snapshot, index) of the index being served; replaced as a whole so readers never see a mix
+_current: Optional[Tuple[CatalogSnapshot, "AutocompleteIndex"]] = None
+_building_snapshot: Optional[CatalogSnapshot] = None
+_index_lock = threading.Lock()
+_first_build_lock = threading.Lock()
+
+
+class AutocompleteIndex:
+    """
+    keys: sıralı, katlanmış anahtarlar (her kelime başlangıcından itibaren)
+    key_suggestions: her anahtarın öneri numarası; key_ranks: öneri popülerliği (büyük = önce)
+    """
+
+    def __init__(self, suggestions: List[dict], keys: List[str], key_suggestions: np.ndarray):
+        self.suggestions = suggestions
+        self.keys = keys
+        self.key_suggestions = key_suggestions
+        self.key_ranks = np.array([suggestions[i]['rank'] for i in key_suggestions], dtype=np.float64)
+
+    def complete(self, prefix: str, limit: int = AUTOCOMPLETE_DEFAULT_LIMIT) -> List[dict]:
+        """Prefix ile başlayan en popüler öneriler (öneri başına bir kez)"""
+        folded = ' '.join(search_tokens(prefix))
+        if not folded or limit <= 0:
+            return []
+        # A trailing space means the last word is complete ('c ' -> 'c yan sehpa', not 'cam')
+        if prefix[-1:].isspace():
+            folded += ' '
+
+        start = bisect.bisect_left(self.keys, folded)
+        end = bisect.bisect_left(self.keys, folded + '\uffff', lo=start)
+        if start == end:
+            return []
+
+        # Duplicates (same suggestion under several keys) are dropped after the top-k
+        ranks = self.key_ranks[start:end]
+        take = min(len(ranks), limit * 4)
+        top = np.argpartition(-ranks, take - 1)[:take] if take < len(ranks) else np.arange(len(ranks))
+        top = top[np.lexsort((top, -ranks[top]))]
+
+        results, seen = [], set()
+        for position in top:
+            suggestion_id = int(self.key_suggestions[start + position])
+            if suggestion_id in seen:
+                continue
+            seen.add(suggestion_id)
+            suggestion = self.suggestions[suggestion_id]
+            results.append({key: suggestion[key] for key in ('text', 'kind', 'product_id')})
+            if len(results) >= limit:
+                break
+        return results
+
+
+def build_autocomplete_index(snapshot: CatalogSnapshot) -> AutocompleteIndex:
+    """Snapshot'taki isim / tag / common query ifadelerinden prefix indeksini oluştur"""
+    suggestions: List[dict] = []
+    suggestion_ids = {}
+
+    def add(text: str, kind: str, entry):
+        folded = ' '.join(search_tokens(text))
+        if not folded:
+            return
+        # Popularity: review count first, rating as tie-breaker (rating < 10)
+        rank = (entry.review_count or 0) * 10 + (entry.rating or 0.0)
+        key = (folded, kind)
+        suggestion_id = suggestion_ids.get(key)
+        if suggestion_id is None:
+            suggestion_ids[key] = len(suggestions)
+            suggestions.append({
+                'text': text,
+                'folded': folded,
+                'kind': kind,
+                'product_id': entry.id if kind == 'product' else None,
+                'rank': rank,
+            })
+        elif rank > suggestions[suggestion_id]['rank']:
+            suggestions[suggestion_id]['rank'] = rank
+
+    for entry in snapshot.entries:
+        if entry.stock <= 0:
+            continue
+        add(entry.name, 'product', entry)
+        for tag in entry.tags:
+            add(tag.replace('_', ' '), 'tag', entry)
+        for query in entry.common_queries:
+            add(query, 'query', entry)
+
+    pairs = []
+    for suggestion_id, suggestion in enumerate(suggestions):
+        words = suggestion['folded'].split(' ')
+        for i in range(len(words)):
+            # Trailing space: a completed word in the prefix also matches the last word
+            pairs.append((' '.join(words[i:]) + ' ', suggestion_id))
+    pairs.sort()
+
+    index = AutocompleteIndex(
+        suggestions,
+        [key for key, _ in pairs],
+        np.array([suggestion_id for _, suggestion_id in pairs], dtype=np.int64)
+    )
+    print(f"🔤 Autocomplete index ready: {len(suggestions)} suggestions, {len(pairs)} keys")
+    return index
+
+
+def _install_index(snapshot: CatalogSnapshot, index: AutocompleteIndex):
+    """İndeksi devreye al; daha yeni bir snapshot'ınki zaten devredeyse dokunma"""
+    global _current
+    with _index_lock:
+        if _current is None or snapshot.loaded_at >= _current[0].loaded_at:
+            _current = (snapshot, index)
+
+
+def _rebuild_in_background(snapshot: CatalogSnapshot):
+    """Snapshot'ın indeksini arka plan thread'inde oluştur (snapshot başına tek build)"""
+    global _building_snapshot
+    with _index_lock:
+        if _building_snapshot is snapshot:
+            return
+        _building_snapshot = snapshot
+
+    def build():
+        global _building_snapshot
+        try:
+            _install_index(snapshot, build_autocomplete_index(snapshot))
+        except Exception as e:
+            print(f"⚠️ Autocomplete index rebuild failed: {e}")
+        finally:
+            with _index_lock:
+                if _building_snapshot is snapshot:
+                    _building_snapshot = None
+
+    threading.Thread(target=build, name="autocomplete-index", daemon=True).start()
+
+
+def get_autocomplete_index(snapshot: CatalogSnapshot = None) -> AutocompleteIndex:
+    """
+    snapshot verilirse (başlangıç, catalog sync swap öncesi) onun indeksi hemen oluşturulur.
+    Verilmezse (istek yolu) güncel snapshot'ın indeksi; henüz hazır değilse arka planda
+    oluşturulurken önceki indeks döner. Sadece ilk indeks istek yolunda oluşturulur.
+    """
+    if snapshot is not None:
+        current = _current
+        if current is not None and current[0] is snapshot:
+            return current[1]
+        index = build_autocomplete_index(snapshot)
+        _install_index(snapshot, index)
+        return index
+
+    snapshot = get_catalog_snapshot()
+    current = _current
+    if current is None:
+        with _first_build_lock:
+            if _current is None:
+                _install_index(snapshot, build_autocomplete_index(snapshot))
+        return _current[1]
+    if current[0] is not snapshot:
+        _rebuild_in_background(snapshot)
+    return current[1]
+
+
+def autocomplete(prefix: str, limit: int = AUTOCOMPLETE_DEFAULT_LIMIT) -> List[dict]:
+    """Yazılan metin için öneriler (tamamen bellekte)"""
+    return get_autocomplete_index().complete(prefix, min(limit, AUTOCOMPLETE_MAX_LIMIT))
@@ -0,0 +1,414 @@
+"""
+In-memory catalog module for e-commerce search.
+Holds a pre-parsed, read-only snapshot of the ecommerce_products table so that
+search requests can be answered without any per-request database I/O.
+Numeric fields, categories and tags are also kept column-wise (NumPy arrays and a
+CSR tag matrix) so filters and tag-overlap scoring run as vectorized operations.
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.models import EcommerceProduct
+from app.text_normalization import canonical_tag, normalize_query
+
+SEARCH_CACHE_SIZE = 512
+
+
+def _parse_json_list(value) -> List[str]:
+    """JSON string kolonunu listeye çevir, bozuk veride boş liste döndür"""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    try:
+        parsed = json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+
+def normalize_search_tags(search_tags: List[str]) -> Tuple[str, ...]:
+    """Sorgu tag'lerini kanonik biçime çevir (bkz. canonical_tag), tekrarsız ve sıralı"""
+    return tuple(sorted({tag for tag in map(canonical_tag, search_tags) if tag}))
+
+
+class TagVocabulary:
+    """
+    Process-wide canonical tag -> integer id table (interning).
+    Ids are only ever appended, so tag ids (and tag matrix columns) mean the same
+    thing in every snapshot built by this process. Tags are stored in their canonical
+    form (see app.text_normalization.canonical_tag), so spelling and token-order
+    variants of a tag share one id and match with a plain hash lookup.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._tags: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    def intern(self, tag: str) -> int:
+        tag_id = self._ids.get(tag)
+        if tag_id is None:
+            with self._lock:
+                tag_id = self._ids.get(tag)
+                if tag_id is None:
+                    tag_id = len(self._tags)
+                    self._tags.append(tag)
+                    self._ids[tag] = tag_id
+        return tag_id
+
+    def tag(self, tag_id: int) -> str:
+        return self._tags[tag_id]
+
+    def lookup(self, tags) -> List[int]:
+        """Kanonik biçimi bilinen tag'lerin id'leri (sıralı, tekrarsız); sözlüğe yeni tag eklemez"""
+        return sorted({self._ids[tag] for tag in map(canonical_tag, tags) if tag in self._ids})
+
+
+TAG_VOCABULARY = TagVocabulary()
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """Snapshot içindeki tek bir ürün (tag'ler önceden parse edilmiş)"""
+    id: str
+    name: str
+    description: str
+    price: float
+    currency: str
+    image_url: Optional[str]
+    tags: Tuple[str, ...]  # Canonical tag ids live in the snapshot's CSR rows (CatalogColumns.tag_ids_at)
+    category: str
+    subcategory: Optional[str]
+    brand: Optional[str]
+    stock: int
+    rating: Optional[float]
+    review_count: Optional[int]
+    common_queries: Tuple[str, ...]
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "CatalogEntry":
+        """Veritabanı satırından (dict) entry oluştur"""
+        # Display tags are kept as-is (one shared string per distinct tag); matching uses canonical ids
+        tags = tuple(sys.intern(tag) for tag in _parse_json_list(row.get('tags')) if isinstance(tag, str))
+        return cls(
+            id=row['id'],
+            name=row['name'],
+            description=row.get('description') or '',
+            price=row['price'],
+            currency=row.get('currency') or 'TL',
+            image_url=row.get('image_url'),
+            tags=tags,
+            category=row.get('category') or '',
+            subcategory=row.get('subcategory'),
+            brand=row.get('brand'),
+            stock=row.get('stock') or 0,
+            rating=row.get('rating'),
+            review_count=row.get('review_count'),
+            common_queries=tuple(_parse_json_list(row.get('common_queries'))),
+        )
+
+    def to_product(self, image_base64: Optional[str] = None,
+                   visual_representation: Optional[str] = None) -> EcommerceProduct:
+        """
+        API'nin beklediği EcommerceProduct modeline dönüştür.
+        Görsel alanları snapshot'ta tutulmaz (üretilen görsel snapshot'ı eskitmesin), ayrıca verilir.
+        """
+        return EcommerceProduct(
+            id=self.id,
+            name=self.name,
+            description=self.description,
+            price=self.price,
+            currency=self.currency,
+            image_url=self.image_url,
+            tags=list(self.tags),
+            category=self.category,
+            subcategory=self.subcategory,
+            brand=self.brand,
+            stock=self.stock,
+            rating=self.rating,
+            review_count=self.review_count,
+            common_queries=list(self.common_queries),
+            image_base64=image_base64,
+            visual_representation=visual_representation
+        )
+
+
+class CatalogColumns:
+    """
+    Column-oriented view of the snapshot entries (same positions as snapshot.entries).
+    price/rating/review_count/stock are NumPy arrays, categories are integer codes and
+    tags are a binary CSR matrix (products x tag ids). Its CSC copy is the tag -> product
+    inverted index: candidate retrieval reads the postings of the query's tag columns
+    instead of scanning every product.
+    """
+
+    def __init__(self, entries: Tuple[CatalogEntry, ...]):
+        count = len(entries)
+        self.prices = np.fromiter((entry.price for entry in entries), dtype=np.float64, count=count)
+        self.ratings = np.fromiter((entry.rating or 0.0 for entry in entries), dtype=np.float64, count=count)
+        self.review_counts = np.fromiter((entry.review_count or 0 for entry in entries), dtype=np.int64, count=count)
+        self.stocks = np.fromiter((entry.stock for entry in entries), dtype=np.int64, count=count)
+
+        self.category_ids: Dict[str, int] = {}
+        self.category_codes = np.fromiter(
+            (self.category_ids.setdefault(entry.category, len(self.category_ids)) for entry in entries),
+            dtype=np.int32,
+            count=count
+        )
+
+        # Stable 64-bit hash per product id: seeded diversification noise is keyed on it
+        self.id_hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(entry.id.encode('utf-8'), digest_size=8).digest(), 'little')
+             for entry in entries),
+            dtype=np.uint64,
+            count=count
+        )
+
+        # Rank of each product id in sorted order: final, stable tie-breaker
+        self.id_ranks = np.empty(count, dtype=np.int64)
+        self.id_ranks[sorted(range(count), key=lambda position: entries[position].id)] = np.arange(count)
+
+        # CSR straight from the interned, sorted tag ids (columns = global vocabulary ids).
+        # The rows are the only per-product copy of the ids (see tag_ids_at).
+        tag_id_lists = [sorted({TAG_VOCABULARY.intern(tag) for tag in map(canonical_tag, entry.tags) if tag})
+                        for entry in entries]
+        self.vocabulary_size = len(TAG_VOCABULARY)
+        indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum([len(tag_ids) for tag_ids in tag_id_lists], out=indptr[1:])
+        indices = np.fromiter((tag_id for tag_ids in tag_id_lists for tag_id in tag_ids),
+                              dtype=np.int32, count=int(indptr[-1]))
+        del tag_id_lists
+        self.tag_matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(count, self.vocabulary_size)
+        )
+        # Postings: column j lists the positions of the products carrying tag j
+        self.tag_matrix_csc = self.tag_matrix.tocsc()
+
+    def tag_ids_at(self, position: int) -> np.ndarray:
+        """Ürünün kanonik tag id'leri (sıralı, tekrarsız); CSR satırının görünümü, kopya değil"""
+        start, end = self.tag_matrix.indptr[position], self.tag_matrix.indptr[position + 1]
+        return self.tag_matrix.indices[start:end]
+
+    def diversity_noise(self, seed: int, positions: np.ndarray) -> np.ndarray:
+        """
+        [0, 0.1) aralığında (seed, ürün id) çiftine bağlı gürültü (splitmix64 karıştırma).
+        Satır sırasından bağımsız: snapshot yeniden yüklense de, ürün başka bir shard'da
+        olsa da aynı seed aynı ürüne aynı gürültüyü verir.
+        """
+        with np.errstate(over='ignore'):
+            x = self.id_hashes[positions] ^ np.uint64((seed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF)
+            x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            x = x ^ (x >> np.uint64(31))
+        return (x >> np.uint64(11)).astype(np.float64) * (0.1 / float(1 << 53))
+
+    def _known_tag_ids(self, tags) -> List[int]:
+        """Bu snapshot'ın matrisinde kolonu olan tag id'leri"""
+        return [tag_id for tag_id in TAG_VOCABULARY.lookup(tags) if tag_id < self.vocabulary_size]
+
+    def filter_mask(self, min_price: float = None, max_price: float = None, category: str = None,
+                    positions: Optional[np.ndarray] = None,
+                    categories: Optional[Tuple[str, ...]] = None) -> np.ndarray:
+        """
+        Stok/fiyat/kategori filtreleri için boolean maske (positions verilirse sadece o satırlar).
+        categories verilirse ürün bu kategorilerden birinde olmalı.
+        """
+        def column(values):
+            return values if positions is None else values[positions]
+
+        mask = column(self.stocks) > 0
+        if min_price is not None:
+            mask &= column(self.prices) >= min_price
+        if max_price is not None:
+            mask &= column(self.prices) <= max_price
+        if category:
+            code = self.category_ids.get(category)
+            if code is None:
+                return np.zeros_like(mask)
+            mask &= column(self.category_codes) == code
+        if categories:
+            codes = [self.category_ids[name] for name in categories if name in self.category_ids]
+            mask &= np.isin(column(self.category_codes), codes)
+        return mask
+
+    def query_tag_matrix(self, tag_lists: List[List[str]]) -> sparse.csr_matrix:
+        """Sorguları (sorgu x tag id) binary matrise çevir; catalog'da olmayan tag'ler düşer"""
+        rows, cols = [], []
+        for query_index, search_tags in enumerate(tag_lists):
+            for tag_id in self._known_tag_ids(search_tags):
+                rows.append(query_index)
+                cols.append(tag_id)
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(tag_lists), self.vocabulary_size)
+        )
+
+    def tag_positions(self, tag: str) -> np.ndarray:
+        """Tag'i (kanonik biçimde) taşıyan ürünlerin pozisyonları; bu snapshot'ta yoksa boş"""
+        tag_ids = self._known_tag_ids([tag])
+        if not tag_ids:
+            return np.empty(0, dtype=np.int64)
+        return self.tag_matrix_csc[:, tag_ids[0]].indices
+
+    def matching_positions(self, search_tags) -> Tuple[np.ndarray, np.ndarray]:
+        """En az bir tag'i eşleşen ürünlerin pozisyonları ve eşleşen tag sayıları"""
+        tag_ids = self._known_tag_ids(search_tags)
+        if not tag_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        columns = self.tag_matrix_csc[:, tag_ids]
+        return np.unique(columns.indices, return_counts=True)
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of the whole catalog.
+    A new snapshot is built on every refresh and swapped in atomically, so a
+    request that already holds a snapshot keeps a consistent view.
+    """
+
+    def __init__(self, entries: List[CatalogEntry]):
+        self.entries: Tuple[CatalogEntry, ...] = tuple(entries)
+        self.positions: Dict[str, int] = {entry.id: position for position, entry in enumerate(self.entries)}
+        self.columns = CatalogColumns(self.entries)
+        self.query_index = self._build_query_index()
+        self.tag_fingerprint = self._compute_tag_fingerprint()
+        self.loaded_at = time.time()
+        # Arama sonuç cache'i snapshot'a bağlı: catalog yazıldığında yeni snapshot = boş cache
+        self._search_cache: "OrderedDict[tuple, Tuple[CatalogEntry, ...]]" = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+
+    def _compute_tag_fingerprint(self) -> str:
+        """Ürün id + kanonik tag'lerin hash'i; tag'lerden türetilen modeller bununla eşleştirilir"""
+        digest = hashlib.sha1()
+        for position in np.argsort(self.columns.id_ranks):
+            digest.update(self.entries[position].id.encode('utf-8'))
+            canonical_tags = [TAG_VOCABULARY.tag(tag_id) for tag_id in self.columns.tag_ids_at(position)]
+            digest.update(json.dumps(canonical_tags, ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _build_query_index(self) -> Dict[str, Tuple[CatalogEntry, ...]]:
+        """Normalize edilmiş common_queries -> ürünler (çok yorumlu / yüksek puanlı önce)"""
+        index: Dict[str, List[CatalogEntry]] = {}
+        for entry in self.entries:
+            for query in {normalize_query(query) for query in entry.common_queries}:
+                if query:
+                    index.setdefault(query, []).append(entry)
+        return {
+            query: tuple(sorted(entries, key=lambda e: (-(e.review_count or 0), -(e.rating or 0.0), e.id)))
+            for query, entries in index.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def match_common_query(self, text: str, limit: int = 4) -> List[CatalogEntry]:
+        """Metin bilinen bir common query ile birebir eşleşiyorsa stoktaki ürünleri döndür"""
+        entries = self.query_index.get(normalize_query(text), ())
+        return [entry for entry in entries if entry.stock > 0][:limit]
+
+    def get(self, product_id: str) -> Optional[CatalogEntry]:
+        position = self.positions.get(product_id)
+        return None if position is None else self.entries[position]
+
+    def search_by_tags(self, search_tags: List[str], limit: int = 4, min_price: float = None,
+                       max_price: float = None, category: str = None,
+                       diversity_seed: Optional[int] = None,
+                       categories: Optional[List[str]] = None) -> List[CatalogEntry]:
+        """
+        Tag kesişimine göre skorla ve en iyi `limit` ürünü döndür (tamamen bellekte).
+        categories verilirse skorlama sadece bu kategorilerdeki ürünlerle sınırlanır.
+        Sıralama deterministiktir; diversity_seed verilirse skorlara seed'li küçük bir
+        rastgelelik eklenir (aynı seed = aynı sonuç). Sonuçlar snapshot ömrü boyunca cache'lenir.
+        """
+        query_tags = normalize_search_tags(search_tags)
+        categories = tuple(sorted(set(categories))) if categories else None
+        cache_key = (query_tags, min_price, max_price, category, limit, diversity_seed, categories)
+
+        with self._search_cache_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                self._search_cache.move_to_end(cache_key)
+                return list(cached)
+
+        results = tuple(self._rank_by_tags(query_tags, limit, min_price, max_price, category, diversity_seed,
+                                           categories))
+
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = results
+            if len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return list(results)
+
+    def _rank_by_tags(self, query_tags: Tuple[str, ...], limit: int, min_price: float, max_price: float,
+                      category: str, diversity_seed: Optional[int],
+                      categories: Optional[Tuple[str, ...]] = None) -> List[CatalogEntry]:
+        scored = self.score_by_tags(query_tags, limit, min_price, max_price, category, diversity_seed, categories)
+        return [entry for entry, _ in scored]
+
+    def score_by_tags(self, query_tags: Tuple[str, ...], limit: int, min_price: float = None,
+                      max_price: float = None, category: str = None,
+                      diversity_seed: Optional[int] = None,
+                      categories: Optional[Tuple[str, ...]] = None) -> List[Tuple[CatalogEntry, float]]:
+        """
+        Cache'siz sıralama; query_tags normalize_search_tags ile normalize edilmiş olmalı.
+        Skor aşaması tamamen kolon dizileri üzerinde: eşleşen adaylar CSR tag matrisinden,
+        filtreler boolean maske, top-k partition ile. Sadece kazananlar (entry, skor) olarak döner.
+        """
+        if limit <= 0:
+            return []
+
+        columns = self.columns
+        positions, matching_counts = columns.matching_positions(query_tags)
+        keep = columns.filter_mask(min_price, max_price, category, positions=positions, categories=categories)
+        positions, matching_counts = positions[keep], matching_counts[keep]
+        if len(positions) == 0:
+            return []
+
+        # Calculate similarity score (intersection of tags), boost if multiple tags match
+        scores = matching_counts / max(len(query_tags), 1)
+        scores = np.where(matching_counts >= 2, scores * 1.5, scores)
+
+        # Optional seeded diversification, keyed on product id (not on row position)
+        if diversity_seed is not None:
+            scores = scores + columns.diversity_noise(diversity_seed, positions)
+
+        # Keep everything tied with the k-th best score, then order exactly
+        if len(scores) > limit:
+            kth_score = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            top = scores >= kth_score
+            positions, scores = positions[top], scores[top]
+
+        # Ties: more reviews, then higher rating, then id -> same query, same order
+        order = np.lexsort((
+            columns.id_ranks[positions],
+            -columns.ratings[positions],
+            -columns.review_counts[positions],
+            -scores,
+        ))
+        order = order[:limit]
+        return [(self.entries[position], float(score)) for position, score in zip(positions[order], scores[order])]
+
+
+def build_catalog_snapshot(rows: List[Dict[str, Any]]) -> CatalogSnapshot:
+    """Veritabanı satırlarından yeni bir snapshot oluştur"""
+    entries = []
+    for row in rows:
+        try:
+            entries.append(CatalogEntry.from_row(row))
+        except (KeyError, TypeError) as e:
+            print(f"Skipping malformed catalog row {row.get('id')}: {e}")
+    return CatalogSnapshot(entries)
@@ -0,0 +1,198 @@
+"""
+Sharded catalog mode for large catalogs.
+Products are partitioned by category into shards. Each shard lives in its own worker
+process (one single-worker process pool per shard, so a shard is loaded only once) and
+a tag search fans out to the shards, each returning its local top-k, which are merged
+here. Scoring then uses all cores instead of one GIL-bound loop.
+
+Enabled with CATALOG_SHARDS=<n> (n >= 2); catalogs smaller than
+CATALOG_SHARD_MIN_PRODUCTS are still searched in-process, where IPC would cost more
+than the scoring itself.
+"""
+import multiprocessing
+import os
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.catalog import CatalogEntry, CatalogSnapshot, SEARCH_CACHE_SIZE, build_catalog_snapshot, normalize_search_tags
+from app import database
+from app.database import _load_catalog_rows
+
+CATALOG_SHARDS = int(os.getenv("CATALOG_SHARDS", "0"))
+CATALOG_SHARD_MIN_PRODUCTS = int(os.getenv("CATALOG_SHARD_MIN_PRODUCTS", "50000"))
+
+# --- Worker process side ---
+
+_worker_token: Optional[int] = None
+_worker_snapshot: Optional[CatalogSnapshot] = None
+
+
+def _init_worker(ecommerce_db_path: str):
+    """Worker: ana process'in kullandığı veritabanını oku (spawn modül durumunu taşımaz)"""
+    database.ECOMMERCE_DB_PATH = Path(ecommerce_db_path)
+
+
+def _search_shard(token: int, categories: List[str], query_tags: Tuple[str, ...], limit: int,
+                  min_price: float, max_price: float, category: str,
+                  diversity_seed: Optional[int], allowed_categories: Optional[Tuple[str, ...]]) -> List[tuple]:
+    """Worker: shard'ı (plan değiştiyse) veritabanından yükle, yerel top-k'yı döndür"""
+    global _worker_token, _worker_snapshot
+    if token != _worker_token:
+        _worker_snapshot = build_catalog_snapshot(_load_catalog_rows(categories))
+        _worker_token = token
+
+    scored = _worker_snapshot.score_by_tags(query_tags, limit, min_price, max_price, category, diversity_seed,
+                                            allowed_categories)
+    # Only what the merge needs crosses the process boundary
+    return [(entry.id, score, entry.review_count or 0, entry.rating or 0.0) for entry, score in scored]
+
+
+# --- Parent process side ---
+
+def plan_shards(snapshot: CatalogSnapshot, num_shards: int) -> List[List[str]]:
+    """Kategorileri ürün sayısına göre shard'lara dağıt (büyükten küçüğe, en boş shard'a)"""
+    counts = Counter(entry.category for entry in snapshot.entries)
+    shards: List[List[str]] = [[] for _ in range(num_shards)]
+    sizes = [0] * num_shards
+    for category, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        target = sizes.index(min(sizes))
+        shards[target].append(category)
+        sizes[target] += count
+    return [shard for shard in shards if shard]
+
+
+class ShardedSnapshot:
+    """Bir catalog snapshot'ına bağlı shard planı; search_by_tags CatalogSnapshot ile aynı arayüz"""
+
+    def __init__(self, catalog: "ShardedCatalog", snapshot: CatalogSnapshot, plan: List[List[str]], token: int):
+        self.catalog = catalog
+        self.snapshot = snapshot
+        self.plan = plan
+        self.token = token
+
+    def search_by_tags(self, search_tags: List[str], limit: int = 4, min_price: float = None,
+                       max_price: float = None, category: str = None,
+                       diversity_seed: Optional[int] = None,
+                       categories: Optional[List[str]] = None) -> List[CatalogEntry]:
+        """
+        Shard'lara paralel dağıt, yerel top-k'ları tek sıralamada birleştir.
+        Sıralama tek snapshot ile aynı (skor, yorum sayısı, puan, id); diversity_seed
+        gürültüsü ürün id'sine bağlı olduğundan shard'lı ve tek snapshot aynı sonucu verir.
+        """
+        query_tags = normalize_search_tags(search_tags)
+        if limit <= 0 or not query_tags:
+            return []
+
+        categories = tuple(sorted(set(categories))) if categories else None
+        cache_key = (self.token, query_tags, min_price, max_price, category, limit, diversity_seed, categories)
+        cached = self.catalog.cached(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        # A category filter only needs the shards holding those categories
+        shard_ids = [
+            i for i, shard_categories in enumerate(self.plan)
+            if (not category or category in shard_categories)
+            and (not categories or any(name in shard_categories for name in categories))
+        ]
+        try:
+            futures = [
+                self.catalog.executor(i).submit(
+                    _search_shard, self.token, self.plan[i], query_tags, limit,
+                    min_price, max_price, category, diversity_seed, categories
+                )
+                for i in shard_ids
+            ]
+            hits = [hit for future in futures for hit in future.result()]
+        except Exception as e:
+            print(f"⚠️ Sharded search failed, searching in-process: {e}")
+            self.catalog.reset()  # fresh worker pools on the next search
+            return self.snapshot.search_by_tags(search_tags, limit=limit, min_price=min_price,
+                                                max_price=max_price, category=category,
+                                                diversity_seed=diversity_seed, categories=categories)
+
+        hits.sort(key=lambda hit: (-hit[1], -hit[2], -hit[3], hit[0]))
+        # A shard may already see a newer database than this snapshot; skip unknown ids
+        entries = [entry for entry in (self.snapshot.get(hit[0]) for hit in hits) if entry is not None][:limit]
+
+        self.catalog.store(cache_key, tuple(entries))
+        return entries
+
+
+class ShardedCatalog:
+    """Shard başına tek worker'lı process pool'lar + birleştirilmiş sonuç cache'i"""
+
+    def __init__(self, num_shards: int):
+        self.num_shards = num_shards
+        self._executors: List[ProcessPoolExecutor] = []
+        self._current: Optional[ShardedSnapshot] = None
+        self._token = 0
+        self._lock = threading.Lock()
+        self._search_cache: "OrderedDict[tuple, Tuple[CatalogEntry, ...]]" = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+        # spawn: worker'lar ana process'in thread'lerini / bağlantılarını miras almasın
+        self._mp_context = multiprocessing.get_context("spawn")
+
+    def for_snapshot(self, snapshot: CatalogSnapshot) -> ShardedSnapshot:
+        """Snapshot değiştiyse yeni shard planı çıkar; worker'lar yeni token ile shard'ı yeniden yükler"""
+        current = self._current
+        if current is not None and current.snapshot is snapshot:
+            return current
+
+        with self._lock:
+            if self._current is None or self._current.snapshot is not snapshot:
+                self._token += 1
+                plan = plan_shards(snapshot, self.num_shards)
+                while len(self._executors) < len(plan):
+                    self._executors.append(ProcessPoolExecutor(
+                        max_workers=1, mp_context=self._mp_context,
+                        initializer=_init_worker, initargs=(str(database.ECOMMERCE_DB_PATH),)
+                    ))
+                with self._search_cache_lock:
+                    self._search_cache.clear()
+                self._current = ShardedSnapshot(self, snapshot, plan, self._token)
+                print(f"🧩 Catalog split into {len(plan)} shards for {len(snapshot)} products")
+            return self._current
+
+    def executor(self, shard_id: int) -> ProcessPoolExecutor:
+        return self._executors[shard_id]
+
+    def cached(self, cache_key: tuple) -> Optional[Tuple[CatalogEntry, ...]]:
+        with self._search_cache_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                self._search_cache.move_to_end(cache_key)
+            return cached
+
+    def store(self, cache_key: tuple, results: Tuple[CatalogEntry, ...]):
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = results
+            if len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+
+    def reset(self):
+        """Worker pool'larını kapat; sonraki arama yeni pool'lar ve yeni plan ile başlar"""
+        with self._lock:
+            for executor in self._executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._executors = []
+            self._current = None
+
+
+_sharded_catalog: Optional[ShardedCatalog] = None
+_sharded_catalog_lock = threading.Lock()
+
+
+def get_sharded_catalog(snapshot: CatalogSnapshot) -> Optional[ShardedSnapshot]:
+    """Sharded mod kapalıysa veya catalog küçükse None (tek process'te ara)"""
+    global _sharded_catalog
+    if CATALOG_SHARDS < 2 or len(snapshot) < CATALOG_SHARD_MIN_PRODUCTS:
+        return None
+    if _sharded_catalog is None:
+        with _sharded_catalog_lock:
+            if _sharded_catalog is None:
+                _sharded_catalog = ShardedCatalog(CATALOG_SHARDS)
+    return _sharded_catalog.for_snapshot(snapshot)
@@ -0,0 +1,212 @@
+"""
+Catalog sync: picks up a new ecommerce_products.csv without a restart.
+A background thread watches the file's mtime (and content hash, so a touch alone
+does nothing); an admin endpoint can also trigger a reload. The diff is applied
+to SQLite first, then the derived in-memory structures (catalog snapshot, tag
+TF-IDF model, ANN index, category router, autocomplete index) are built on the
+side and swapped in atomically. Requests that already hold the old snapshot keep
+using it until they finish.
+
+A failed sync is retried on the next poll: the file is only marked as applied after
+the swap. A sync that would delete more than CATALOG_SYNC_MAX_DELETE_RATIO of the
+catalog (a truncated or half-copied CSV) is refused; the watcher skips that file
+until it changes again (a forced reload still retries it).
+
+Note: /admin/catalog/reload is not authenticated; keep it off the public network.
+"""
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from app.database import (
+    CSV_PATH,
+    upsert_ecommerce_products_from_csv,
+    load_catalog_snapshot,
+    swap_catalog_snapshot,
+    invalidate_catalog_snapshot,
+)
+from app.tag_vectors import get_tag_vector_model
+from app.ann_index import get_ann_index
+from app.category_router import get_category_router
+from app.autocomplete import get_autocomplete_index
+
+# Polling interval for the CSV watcher; 0 disables the watcher (admin trigger still works)
+CATALOG_SYNC_INTERVAL_SECONDS = float(os.getenv("CATALOG_SYNC_INTERVAL_SECONDS", "30"))
+# Largest share of the catalog one sync may delete; above it the CSV is assumed truncated
+CATALOG_SYNC_MAX_DELETE_RATIO = float(os.getenv("CATALOG_SYNC_MAX_DELETE_RATIO", "0.5"))
+
+
+def _file_sha256(path: Path) -> str:
+    """Dosyayı parça parça okuyarak hash'le"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CatalogSync:
+    """CSV değişikliklerini algılayıp catalog'u arka planda yeniden yükler"""
+
+    def __init__(self, csv_path: Path = CSV_PATH, interval: float = CATALOG_SYNC_INTERVAL_SECONDS):
+        self.csv_path = csv_path
+        self.interval = interval
+        self._last_mtime: Optional[float] = None
+        self._last_hash: Optional[str] = None
+        # Last file refused by the delete guard; not re-read until its content changes
+        self._refused_mtime: Optional[float] = None
+        self._refused_hash: Optional[str] = None
+        self._sync_lock = threading.Lock()  # one sync at a time
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {
+            'running': False,
+            'last_sync_at': None,
+            'last_stats': None,
+            'last_error': None,
+            'csv_hash': None,
+        }
+
+    def remember_current_file(self):
+        """Başlangıçta yüklenen CSV'yi 'bilinen' sürüm olarak kaydet"""
+        if self.csv_path.exists():
+            self._last_mtime = self.csv_path.stat().st_mtime
+            self._last_hash = _file_sha256(self.csv_path)
+            self.status['csv_hash'] = self._last_hash
+
+    def _changed_file(self) -> Optional[tuple]:
+        """
+        CSV değiştiyse (mtime, hash), değişmediyse None (önce ucuz mtime kontrolü).
+        Durumu değiştirmez; dosya ancak başarılı swap'tan sonra 'uygulandı' sayılır.
+        """
+        if not self.csv_path.exists():
+            return None
+        mtime = self.csv_path.stat().st_mtime
+        if mtime in (self._last_mtime, self._refused_mtime):
+            return None
+        file_hash = _file_sha256(self.csv_path)
+        if file_hash == self._last_hash:
+            self._last_mtime = mtime  # touched only; skip hashing it again
+            return None
+        if file_hash == self._refused_hash:
+            self._refused_mtime = mtime
+            return None
+        return mtime, file_hash
+
+    def sync(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        CSV değiştiyse (veya force=True ise) diff'i uygula ve yeni catalog'u devreye al.
+        Başka bir sync zaten çalışıyorsa beklemeden None döndürür.
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return None
+        refused = False
+        try:
+            changed_file = self._changed_file()
+            if changed_file is None and not force:
+                return None
+            if changed_file is None:
+                changed_file = (self.csv_path.stat().st_mtime, _file_sha256(self.csv_path))
+            mtime, file_hash = changed_file
+
+            self.status['running'] = True
+            start_time = time.time()
+            print(f"🔄 Catalog sync: applying {self.csv_path.name}...")
+
+            stats = upsert_ecommerce_products_from_csv(self.csv_path, delete_missing=True, invalidate=False,
+                                                       max_delete_ratio=CATALOG_SYNC_MAX_DELETE_RATIO)
+            if stats['refused_deletes']:
+                refused = True
+                self._refused_mtime, self._refused_hash = mtime, file_hash
+                if stats['inserted'] or stats['updated']:
+                    invalidate_catalog_snapshot()  # the upserted rows are in SQLite
+                raise ValueError(
+                    f"Refusing to delete {stats['refused_deletes']} products missing from {self.csv_path.name} "
+                    f"(max ratio {CATALOG_SYNC_MAX_DELETE_RATIO:g}); is the CSV truncated?"
+                )
+
+            # Build the new search structures off to the side, then swap them in.
+            # Even with no row changes the snapshot is rebuilt, since another process
+            # may already have written this CSV version to the shared database.
+            snapshot, generation = load_catalog_snapshot()
+            get_tag_vector_model(snapshot)
+            get_ann_index(snapshot)
+            get_category_router(snapshot)
+            get_autocomplete_index(snapshot)
+            swap_catalog_snapshot(snapshot, generation)
+
+            self._last_mtime, self._last_hash = mtime, file_hash
+            self._refused_mtime = self._refused_hash = None
+            stats['duration'] = time.time() - start_time
+            self.status.update({
+                'last_sync_at': time.time(),
+                'last_stats': stats,
+                'last_error': None,
+                'csv_hash': file_hash,
+            })
+            print(f"✅ Catalog sync done: {stats}")
+            return stats
+        except Exception as e:
+            # Chunks are committed one by one, so SQLite may be partly updated: drop the
+            # snapshot so the next read reloads from the database. The file stays
+            # "unapplied" and the next poll retries (a refused file only once it changes).
+            if not refused:
+                invalidate_catalog_snapshot()
+            self.status['last_error'] = str(e)
+            print(f"❌ Catalog sync failed: {e}")
+            raise
+        finally:
+            self.status['running'] = False
+            self._sync_lock.release()
+
+    def trigger(self, force: bool = True) -> bool:
+        """Sync'i arka plan thread'inde başlat; zaten çalışıyorsa False döndür"""
+        if self._sync_lock.locked():
+            return False
+        threading.Thread(target=self._sync_quietly, args=(force,), daemon=True).start()
+        return True
+
+    def _sync_quietly(self, force: bool = False):
+        try:
+            self.sync(force=force)
+        except Exception:
+            pass  # already recorded in status
+
+    def _watch(self):
+        while not self._stop_event.wait(self.interval):
+            self._sync_quietly()
+
+    def start(self):
+        """CSV watcher thread'ini başlat (interval 0 ise sadece manuel tetikleme)"""
+        if self._last_hash is None:
+            self.remember_current_file()
+        if self.interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="catalog-sync", daemon=True)
+        self._watcher.start()
+        print(f"👀 Watching {self.csv_path.name} for catalog changes every {self.interval:g}s")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_catalog_sync: Optional[CatalogSync] = None
+
+
+def get_catalog_sync() -> CatalogSync:
+    """Process-wide catalog sync instance"""
+    global _catalog_sync
+    if _catalog_sync is None:
+        _catalog_sync = CatalogSync()
+    return _catalog_sync
+
+
+def start_catalog_sync() -> CatalogSync:
+    """Başlangıçta çağrılır: mevcut CSV'yi kaydet ve watcher'ı başlat"""
+    catalog_sync = get_catalog_sync()
+    catalog_sync.start()
+    return catalog_sync
@@ -0,0 +1,110 @@
+"""
+Query-to-category router.
+Each category gets a centroid: the normalized mean of its products' hashed tag/description
+vectors (the same vectors as the ANN index). A tag set is routed to its closest categories
+so search only scores those; when the best categories are not clearly ahead, routing
+returns None and the caller scans the whole catalog.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from app.ann_index import _vectorizer, query_text, get_ann_index
+from app.catalog import CatalogSnapshot, normalize_search_tags
+from app.database import get_catalog_snapshot
+
+CATEGORY_ROUTER_TOP_K = int(os.getenv("CATEGORY_ROUTER_TOP_K", "2"))
+CATEGORY_ROUTER_MIN_SCORE = float(os.getenv("CATEGORY_ROUTER_MIN_SCORE", "0.15"))
+# Best kept category must beat the best excluded one by this much, otherwise full scan
+CATEGORY_ROUTER_MIN_MARGIN = float(os.getenv("CATEGORY_ROUTER_MIN_MARGIN", "0.05"))
+ROUTE_CACHE_SIZE = 1024
+
+_router: Optional["CategoryRouter"] = None
+_router_snapshot: Optional[CatalogSnapshot] = None
+_router_lock = threading.Lock()
+
+
+class CategoryRouter:
+    """Kategori adları + L2-normalize centroid matrisi (kategori x feature)"""
+
+    def __init__(self, categories: List[str], centroids: sparse.csr_matrix):
+        self.categories = categories
+        self.centroids = centroids
+        # Vectorizing the query dominates; repeated tag sets are answered from here
+        self._route_cache: "OrderedDict[tuple, Optional[List[str]]]" = OrderedDict()
+        self._route_cache_lock = threading.Lock()
+
+    def scores(self, search_tags: List[str]) -> List[Tuple[str, float]]:
+        """Her kategori için sorgu-centroid kosinüs benzerliği, büyükten küçüğe"""
+        if not self.categories:
+            return []
+        query_vector = _vectorizer.transform([query_text(search_tags)])
+        similarities = np.asarray((self.centroids @ query_vector.T).todense()).ravel()
+        order = np.argsort(-similarities, kind='stable')
+        return [(self.categories[i], float(similarities[i])) for i in order]
+
+    def route(self, search_tags: List[str], top_k: int = CATEGORY_ROUTER_TOP_K,
+              min_score: float = CATEGORY_ROUTER_MIN_SCORE,
+              min_margin: float = CATEGORY_ROUTER_MIN_MARGIN) -> Optional[List[str]]:
+        """En olası top_k kategori; güven düşükse (veya budanacak kategori yoksa) None"""
+        query_tags = normalize_search_tags(search_tags)
+        cache_key = (query_tags, top_k, min_score, min_margin)
+        with self._route_cache_lock:
+            if cache_key in self._route_cache:
+                self._route_cache.move_to_end(cache_key)
+                return self._route_cache[cache_key]
+
+        categories = None
+        ranked = self.scores(list(query_tags))
+        if len(ranked) > top_k:
+            best_score = ranked[0][1]
+            if best_score >= min_score and best_score - ranked[top_k][1] >= min_margin:
+                categories = [category for category, _ in ranked[:top_k]]
+
+        with self._route_cache_lock:
+            self._route_cache[cache_key] = categories
+            if len(self._route_cache) > ROUTE_CACHE_SIZE:
+                self._route_cache.popitem(last=False)
+        return categories
+
+
+def build_category_router(snapshot: CatalogSnapshot) -> CategoryRouter:
+    """Centroid'leri ANN indeksinin ürün vektörlerinden hesapla"""
+    index = get_ann_index(snapshot)
+    entry_categories = [snapshot.get(product_id).category for product_id in index.product_ids]
+    categories = sorted(set(entry_categories))
+    if not categories:
+        return CategoryRouter([], sparse.csr_matrix((0, index.vectors.shape[1])))
+
+    category_index = {category: i for i, category in enumerate(categories)}
+    membership = sparse.csr_matrix(
+        (np.ones(len(entry_categories)), ([category_index[c] for c in entry_categories], np.arange(len(entry_categories)))),
+        shape=(len(categories), len(entry_categories))
+    )
+    centroids = normalize(membership @ index.vectors).tocsr()
+    print(f"🧭 Category router ready for {len(categories)} categories")
+    return CategoryRouter(categories, centroids)
+
+
+def get_category_router(snapshot: CatalogSnapshot = None) -> CategoryRouter:
+    """Verilen (varsayılan: güncel) snapshot'a ait router (snapshot değişince yeniden hesaplanır)"""
+    global _router, _router_snapshot
+    if snapshot is None:
+        snapshot = get_catalog_snapshot()
+    if _router_snapshot is snapshot:
+        return _router
+
+    with _router_lock:
+        if _router_snapshot is not snapshot:
+            _router, _router_snapshot = build_category_router(snapshot), snapshot
+        return _router
+
+
+def route_categories(search_tags: List[str]) -> Optional[List[str]]:
+    """Tag listesi için aranacak kategoriler; None = tüm catalog'u tara"""
+    return get_category_router().route(search_tags)
@@ -2,8 +2,13 @@
 Database module for product and e-commerce data management.
 Contains all database initialization, CRUD operations and search functionality.
 """
+import base64
+import binascii
+import hashlib
 import json
 import sqlite3
+import threading
+import time
 import uuid
 import csv
 from pathlib import Path
@@ -13,6 +18,8 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
 from app.models import EcommerceProduct
+from app.catalog import CatalogSnapshot, build_catalog_snapshot
+from app.text_normalization import fold_turkish, search_tokens
 
 # Database paths
 DB_PATH = Path(__file__).parent / "data" / "products.db"
@@ -22,11 +29,245 @@ CSV_PATH = Path(__file__).parent / "ecommerce_products.csv"
 # Ensure data directory exists
 DB_PATH.parent.mkdir(exist_ok=True)
 
-def init_database():
-    """Initialize the products database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# CSV catalog format: optional title line, header, then ';'-separated rows
+CSV_DELIMITER = ';'
+CSV_CHUNK_SIZE = 1000  # rows per upsert transaction
+_CSV_PRODUCT_FIELDS = (
+    'id', 'name', 'description', 'price', 'currency', 'image_url', 'tags', 'category',
+    'subcategory', 'brand', 'stock', 'rating', 'review_count', 'common_queries',
+)
+
+# SQLite tuning for the shared connection layer
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+SQLITE_CACHE_SIZE_KB = 16 * 1024  # page cache per connection
+SQLITE_MMAP_SIZE_BYTES = 128 * 1024 * 1024
+SQLITE_STATEMENT_CACHE_SIZE = 128  # prepared statements reused per connection
+
+# One connection per (thread, database file); see get_connection()
+_thread_local = threading.local()
+
+# Cached existence check for the saved products FTS table (see _products_fts_enabled)
+_products_fts_exists: Optional[bool] = None
+
+# Process-wide in-memory catalog snapshot (see app.catalog)
+_catalog_snapshot: Optional[CatalogSnapshot] = None
+_catalog_generation = 0  # bumped on every invalidate; guards swap_catalog_snapshot
+_catalog_lock = threading.Lock()
+
+# Short-lived cache for COUNT / GROUP BY results (see _cached_aggregate)
+AGGREGATE_CACHE_TTL_SECONDS = 30
+_aggregate_cache: Dict[str, tuple] = {}
+_aggregate_cache_lock = threading.Lock()
+
+def _open_connection(db_path: Path) -> sqlite3.Connection:
+    """Yeni bir SQLite bağlantısı aç ve performans pragmalarını uygula"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+        cached_statements=SQLITE_STATEMENT_CACHE_SIZE
+    )
+    # WAL: okuyucular yazıcıları beklemez, yazıcılar okuyucuları bloklamaz
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE_BYTES}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+def get_connection(db_path: Path = ECOMMERCE_DB_PATH) -> sqlite3.Connection:
+    """
+    Thread-local, tuned SQLite connection for the given database file.
+    Connections are opened once per thread and reused, so connection setup and
+    statement preparation stay off the request path. Callers must not close the
+    returned connection; use `with conn:` around writes to commit or roll back.
+    """
+    connections = getattr(_thread_local, 'connections', None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = _open_connection(db_path)
+    return conn
+
+# --- Category queries ---
+# Kategori başına tekilleştirilmiş common_queries; ürün yazımlarından sonra yeniden hesaplanır.
+
+def _create_category_queries_table(cursor):
+    # Deduplicated common_queries per category; frequency = number of products listing the query
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_queries (
+            category TEXT NOT NULL,
+            query TEXT NOT NULL,
+            frequency INTEGER NOT NULL,
+            PRIMARY KEY (category, query)
+        ) WITHOUT ROWID
+    ''')
+
+def _rebuild_category_queries(cursor):
+    """
+    category_queries tablosunu ecommerce_products'tan yeniden hesapla.
+    ecommerce_products'a yazan fonksiyonlar yazma bittikten sonra (aynı transaction'da) çağırır.
+    """
+    cursor.execute('DELETE FROM category_queries')
+    cursor.execute('''
+        INSERT INTO category_queries (category, query, frequency)
+        SELECT p.category, TRIM(q.value), COUNT(DISTINCT p.id)
+        FROM ecommerce_products p, json_each(p.common_queries) q
+        WHERE p.category IS NOT NULL
+          AND json_valid(p.common_queries)
+          AND q.type = 'text'
+          AND TRIM(q.value) != ''
+        GROUP BY p.category, TRIM(q.value)
+    ''')
+
+# --- Image blob store ---
+# Üretilen görseller katalog satırlarında base64 TEXT olarak değil, içerik hash'i ile
+# adreslenen image_blobs tablosunda ham byte olarak tutulur. Satırlar sadece
+# image_hash referansını taşır; görseller yalnızca gerektiğinde okunur.
+
+def _create_image_blobs_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            hash TEXT PRIMARY KEY,  -- sha256 of the raw image bytes
+            mime_type TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _detect_image_mime_type(data: bytes) -> str:
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    return 'application/octet-stream'
+
+def _decode_image_blob(image_base64: Optional[str]) -> Optional[tuple]:
+    """Base64 görseli (hash, mime_type, data) satırına çevir; görsel yoksa veya çözülemiyorsa None"""
+    if not image_base64:
+        return None
+    try:
+        data = base64.b64decode(image_base64, validate=True)
+    except (binascii.Error, ValueError) as e:
+        print(f"Warning: could not decode image data, skipping image: {e}")
+        return None
+    return hashlib.sha256(data).hexdigest(), _detect_image_mime_type(data), data
+
+_INSERT_IMAGE_BLOB_SQL = 'INSERT OR IGNORE INTO image_blobs (hash, mime_type, data) VALUES (?, ?, ?)'
+
+def _store_image_blob(cursor, image_base64: Optional[str]) -> Optional[str]:
+    """
+    Base64 görseli ham byte olarak image_blobs'a yaz (aynı içerik tek kez saklanır).
     
+    Returns:
+        Görselin içerik hash'i, görsel yoksa veya çözülemiyorsa None
+    """
+    blob = _decode_image_blob(image_base64)
+    if blob is None:
+        return None
+    cursor.execute(_INSERT_IMAGE_BLOB_SQL, blob)
+    return blob[0]
+
+def _load_images_base64(db_path: Path, image_hashes) -> Dict[str, str]:
+    """Verilen hash'lerin görsellerini tek sorguda okuyup base64 olarak döndür"""
+    unique_hashes = list({h for h in image_hashes if h})
+    if not unique_hashes:
+        return {}
+    
+    conn = get_connection(db_path)
+    placeholders = ', '.join('?' * len(unique_hashes))
+    rows = conn.execute(
+        f'SELECT hash, data FROM image_blobs WHERE hash IN ({placeholders})',
+        unique_hashes
+    ).fetchall()
+    return {image_hash: base64.b64encode(data).decode('utf-8') for image_hash, data in rows}
+
+def _load_catalog_media(product_ids, include_images: bool = True) -> Dict[str, tuple]:
+    """
+    Catalog ürünlerinin güncel (visual_representation, base64 görsel) değerleri, tek sorguda.
+    Görsel alanları snapshot'ta tutulmaz: üretilen görseller snapshot'ı yenilemeden görünür.
+    """
+    unique_ids = list(dict.fromkeys(product_ids))
+    if not unique_ids:
+        return {}
+    
+    placeholders = ', '.join('?' * len(unique_ids))
+    rows = get_connection(ECOMMERCE_DB_PATH).execute(f'''
+        SELECT p.id, p.visual_representation, b.data
+        FROM ecommerce_products p
+        LEFT JOIN image_blobs b ON ? AND b.hash = p.image_hash
+        WHERE p.id IN ({placeholders})
+    ''', [int(include_images), *unique_ids]).fetchall()
+    return {
+        product_id: (visual_representation, base64.b64encode(data).decode('utf-8') if data is not None else None)
+        for product_id, visual_representation, data in rows
+    }
+
+def _catalog_entries_to_products(entries, include_images: bool = True) -> List[EcommerceProduct]:
+    """Snapshot entry'lerini güncel görsel alanlarıyla EcommerceProduct'a çevir"""
+    media = _load_catalog_media([entry.id for entry in entries], include_images)
+    products = []
+    for entry in entries:
+        visual_representation, image_base64 = media.get(entry.id, (None, None))
+        products.append(entry.to_product(image_base64=image_base64, visual_representation=visual_representation))
+    return products
+
+def _move_inline_images_to_blob_store(cursor, table: str):
+    """Satırlardaki image_base64 verisini image_blobs'a taşı ve image_hash ile referansla"""
+    cursor.execute(f'SELECT id, image_base64 FROM {table} WHERE image_base64 IS NOT NULL')
+    for row_id, image_base64 in cursor.fetchall():
+        image_hash = _store_image_blob(cursor, image_base64)
+        if image_hash:
+            cursor.execute(
+                f'UPDATE {table} SET image_hash = ?, image_base64 = NULL WHERE id = ?',
+                (image_hash, row_id)
+            )
+
+# --- Full-text index for saved products ---
+# products_fts, kaydedilen ürünlerin Türkçe katlanmış (ı->i, ş->s, ğ->g) metnini tutar.
+# Katlama Python tarafında yapılır çünkü unicode61 tokenizer 'ı' harfini 'i'ye çevirmez.
+
+def _fts5_available(cursor) -> bool:
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+def _index_saved_products_fts(cursor, products: List[tuple]):
+    """(product_id, urun_adi, urun_aciklama, visual_representation) satırlarını FTS indeksine yaz"""
+    cursor.executemany(
+        '''
+        INSERT INTO products_fts (product_id, urun_adi, urun_aciklama, visual_representation)
+        VALUES (?, ?, ?, ?)
+        ''',
+        [(product_id, fold_turkish(name), fold_turkish(description), fold_turkish(visual))
+         for product_id, name, description, visual in products]
+    )
+
+def _products_fts_enabled() -> bool:
+    """products_fts tablosu var mı (sonuç process boyunca cache'lenir)"""
+    global _products_fts_exists
+    if _products_fts_exists is None:
+        row = get_connection(DB_PATH).execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).fetchone()
+        _products_fts_exists = row is not None
+    return _products_fts_exists
+
+def _fts_match_expression(query: str) -> Optional[str]:
+    """Kullanıcı sorgusunu güvenli bir FTS5 MATCH ifadesine çevir (her token prefix olarak, AND)"""
+    tokens = search_tokens(query)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+# --- Schema migrations ---
+# Her veritabanının şema versiyonu PRAGMA user_version'da tutulur. Şema değişikliği
+# listeye yeni bir migration eklenerek yapılır. Migration'lar sadece
+# initialize_all_databases() içinde bir kez çalışır; istek yolunda DDL yapılmaz.
+
+def _products_v1_create_products_table(cursor):
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS products (
             id TEXT PRIMARY KEY,
@@ -41,15 +282,8 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
-    conn.commit()
-    conn.close()
 
-def init_ecommerce_database():
-    """Initialize the e-commerce database with dummy products"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
-    cursor = conn.cursor()
-    
+def _ecommerce_v1_create_products_table(cursor):
     # Create e-commerce products table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS ecommerce_products (
@@ -70,6 +304,162 @@ def init_ecommerce_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+
+def _ecommerce_v2_add_image_columns(cursor):
+    # Eski sürümler bu kolonları update_product_image_base64 içinde ekliyordu
+    cursor.execute("PRAGMA table_info(ecommerce_products)")
+    columns = {column[1] for column in cursor.fetchall()}
+    
+    if 'image_base64' not in columns:
+        cursor.execute('ALTER TABLE ecommerce_products ADD COLUMN image_base64 TEXT')
+    
+    if 'visual_representation' not in columns:
+        cursor.execute('ALTER TABLE ecommerce_products ADD COLUMN visual_representation TEXT')
+
+def _products_v2_image_blob_store(cursor):
+    _create_image_blobs_table(cursor)
+    cursor.execute('ALTER TABLE products ADD COLUMN image_hash TEXT')
+    _move_inline_images_to_blob_store(cursor, 'products')
+
+def _ecommerce_v3_image_blob_store(cursor):
+    _create_image_blobs_table(cursor)
+    cursor.execute('ALTER TABLE ecommerce_products ADD COLUMN image_hash TEXT')
+    _move_inline_images_to_blob_store(cursor, 'ecommerce_products')
+
+def _products_v3_full_text_index(cursor):
+    if not _fts5_available(cursor):
+        print("Warning: SQLite was built without FTS5, saved product search will use LIKE")
+        return
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            product_id UNINDEXED,
+            urun_adi,
+            urun_aciklama,
+            visual_representation,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    cursor.execute('SELECT id, urun_adi, urun_aciklama, visual_representation FROM products')
+    _index_saved_products_fts(cursor, cursor.fetchall())
+
+def _ecommerce_v4_listing_indexes(cursor):
+    # Listing order (rating, review_count, id) -> keyset pagination without a sort step
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ecommerce_products_listing
+        ON ecommerce_products(COALESCE(rating, 0), COALESCE(review_count, 0), id)
+    ''')
+    # Category stats (GROUP BY category over price / stock) and per-category shard loads.
+    # Price / stock filters for search run in memory (CatalogColumns.filter_mask), not in SQL.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ecommerce_products_category_price
+        ON ecommerce_products(category, price, stock)
+    ''')
+
+def _ecommerce_v5_content_hash(cursor):
+    # Per-row hash of the CSV-sourced fields; reloads only rewrite rows whose hash changed
+    cursor.execute('ALTER TABLE ecommerce_products ADD COLUMN content_hash TEXT')
+    cursor.execute('''
+        SELECT id, name, description, price, currency, image_url, tags, category,
+               subcategory, brand, stock, rating, review_count, common_queries
+        FROM ecommerce_products
+    ''')
+    hashes = []
+    for row in cursor.fetchall():
+        product = dict(zip(_CSV_PRODUCT_FIELDS, row))
+        product['tags'] = json.loads(product['tags']) if product['tags'] else []
+        product['common_queries'] = json.loads(product['common_queries']) if product['common_queries'] else []
+        hashes.append((_product_content_hash(product), product['id']))
+    cursor.executemany('UPDATE ecommerce_products SET content_hash = ? WHERE id = ?', hashes)
+
+def _ecommerce_v6_category_queries(cursor):
+    _create_category_queries_table(cursor)
+    _rebuild_category_queries(cursor)
+
+def _ecommerce_v7_drop_product_tags(cursor):
+    # Tag search runs on the in-memory snapshot (CatalogColumns); the SQL inverted index was never read
+    cursor.execute('DROP TABLE IF EXISTS product_tags')
+
+def _ecommerce_v8_drop_price_index(cursor):
+    # No SQL query filters or sorts by price; the index only slowed down every upsert
+    cursor.execute('DROP INDEX IF EXISTS idx_ecommerce_products_price')
+
+PRODUCTS_MIGRATIONS = [
+    _products_v1_create_products_table,
+    _products_v2_image_blob_store,
+    _products_v3_full_text_index,
+]
+
+ECOMMERCE_MIGRATIONS = [
+    _ecommerce_v1_create_products_table,
+    _ecommerce_v2_add_image_columns,
+    _ecommerce_v3_image_blob_store,
+    _ecommerce_v4_listing_indexes,
+    _ecommerce_v5_content_hash,
+    _ecommerce_v6_category_queries,
+    _ecommerce_v7_drop_product_tags,
+    _ecommerce_v8_drop_price_index,
+]
+
+def _apply_migrations(db_path: Path, migrations: list) -> int:
+    """
+    Veritabanını en güncel şema versiyonuna taşı.
+    Her migration kendi transaction'ında çalışır ve user_version ile birlikte commit edilir.
+    API ve MCP server aynı anda başlayabilir: yazma kilidi (BEGIN IMMEDIATE) alındıktan
+    sonra user_version yeniden okunur, böylece bir adım yalnızca bir process'te çalışır.
+    
+    Returns:
+        Migration sonrası şema versiyonu
+    """
+    conn = get_connection(db_path)
+    
+    for version, migration in enumerate(migrations, start=1):
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+            continue
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Another process may have applied this step while we waited for the lock
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Migrated {db_path.name} to schema version {version} ({migration.__name__})")
+    
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate_databases():
+    """Tüm veritabanlarının şemasını güncelle"""
+    _apply_migrations(DB_PATH, PRODUCTS_MIGRATIONS)
+    _apply_migrations(ECOMMERCE_DB_PATH, ECOMMERCE_MIGRATIONS)
+
+# Fixed column lists for reads (schema is guaranteed by migrations).
+# image_base64 kolonları artık kullanılmıyor; görseller image_hash ile image_blobs'tan okunur.
+ECOMMERCE_PRODUCT_COLUMNS = '''
+    id, name, description, price, currency, image_url, tags, category,
+    subcategory, brand, stock, rating, review_count, common_queries,
+    image_hash, visual_representation
+'''
+
+# Snapshot'a giren kolonlar; görsel alanları sonuç dönerken _load_catalog_media ile okunur
+CATALOG_SNAPSHOT_COLUMNS = '''
+    id, name, description, price, currency, image_url, tags, category,
+    subcategory, brand, stock, rating, review_count, common_queries
+'''
+
+SAVED_PRODUCT_COLUMNS = '''
+    id, urun_adi, urun_aciklama, urun_adi_en,
+    visual_representation, image_hash, tags,
+    confidence_score, category, created_at
+'''
+
+def init_ecommerce_database():
+    """Initialize the e-commerce database with dummy products"""
+    conn = get_connection(ECOMMERCE_DB_PATH)
+    cursor = conn.cursor()
     
     # Check if we already have products
     cursor.execute('SELECT COUNT(*) FROM ecommerce_products')
@@ -495,176 +885,232 @@ def init_ecommerce_database():
             p['category'], p.get('subcategory'), p.get('brand'),
             p.get('stock', 0), p.get('rating'), p.get('review_count')
         ) for p in dummy_products])
+        _rebuild_category_queries(cursor)
         
         conn.commit()
+        invalidate_catalog_snapshot()
     
-    conn.close()
 
-def load_ecommerce_data_from_csv():
-    """CSV dosyasından e-ticaret ürünlerini yükle"""
-    print(f"Loading e-commerce data from CSV: {CSV_PATH}")
-    
-    if not CSV_PATH.exists():
-        print(f"CSV file not found at {CSV_PATH}")
+def _parse_csv_json_list(value: str) -> list:
+    """CSV'deki JSON liste alanını parse et (csv modülü dış tırnakları ve "" kaçışlarını zaten çözer)"""
+    try:
+        parsed = json.loads(value) if value else []
+    except json.JSONDecodeError:
         return []
-    
-    products = []
+    return parsed if isinstance(parsed, list) else []
+
+def _parse_csv_product(product_data: Dict[str, str], line_num: int) -> Optional[Dict[str, Any]]:
+    """Tek bir CSV satırını ürün dict'ine çevir, hatalı satırda None döndür"""
+    # Numeric değerleri dönüştür
     try:
-        with open(CSV_PATH, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            
-            # İlk satır başlık, ikinci satır sütun isimleri
-            if len(lines) < 3:
-                print("CSV file has insufficient data")
-                return []
-            
-            # Header'ı parse et (2. satır)
-            header_line = lines[1].strip()
-            headers = header_line.split(';')
-            print(f"CSV Headers: {headers}")
-            
-            # Veri satırlarını parse et (3. satırdan başlayarak)
-            for line_num, line in enumerate(lines[2:], start=3):
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                try:
-                    values = line.split(';')
-                    if len(values) != len(headers):
-                        print(f"Warning: Line {line_num} has {len(values)} values but expected {len(headers)}")
-                        continue
-                    
-                    # Veriyi dictionary'e dönüştür
-                    product_data = dict(zip(headers, values))
-                    
-                    # JSON stringlerini parse et
-                    try:
-                        tags_str = product_data.get('tags', '[]')
-                        # Remove outer quotes if present
-                        if tags_str.startswith('"') and tags_str.endswith('"'):
-                            tags_str = tags_str[1:-1]
-                        # Fix escaped quotes in CSV
-                        tags_str = tags_str.replace('""', '"')
-                        tags = json.loads(tags_str)
-                    except json.JSONDecodeError:
-                        tags = []
-                    
-                    try:
-                        queries_str = product_data.get('common_queries', '[]')
-                        # Remove outer quotes if present
-                        if queries_str.startswith('"') and queries_str.endswith('"'):
-                            queries_str = queries_str[1:-1]
-                        # Fix escaped quotes in CSV
-                        queries_str = queries_str.replace('""', '"')
-                        common_queries = json.loads(queries_str)
-                    except json.JSONDecodeError:
-                        common_queries = []
-                    
-                    # Numeric değerleri dönüştür
-                    try:
-                        price = float(product_data.get('price', 0))
-                        stock = int(product_data.get('stock', 0))
-                        rating = float(product_data.get('rating', 0)) if product_data.get('rating') else None
-                        review_count = int(product_data.get('review_count', 0)) if product_data.get('review_count') else None
-                    except ValueError as e:
-                        print(f"Warning: Invalid numeric data in line {line_num}: {e}")
-                        continue
-                    
-                    product = {
-                        'id': product_data.get('id'),
-                        'name': product_data.get('name', ''),
-                        'description': product_data.get('description', ''),
-                        'price': price,
-                        'currency': product_data.get('currency', 'TL'),
-                        'image_url': product_data.get('image_url'),
-                        'tags': tags,
-                        'category': product_data.get('category', ''),
-                        'subcategory': product_data.get('subcategory'),
-                        'brand': product_data.get('brand'),
-                        'stock': stock,
-                        'rating': rating,
-                        'review_count': review_count,
-                        'common_queries': common_queries
-                    }
-                    
-                    products.append(product)
-                    
-                except Exception as e:
-                    print(f"Error parsing line {line_num}: {e}")
-                    continue
+        price = float(product_data.get('price') or 0)
+        stock = int(product_data.get('stock') or 0)
+        rating = float(product_data['rating']) if product_data.get('rating') else None
+        review_count = int(product_data['review_count']) if product_data.get('review_count') else None
+    except ValueError as e:
+        print(f"Warning: Invalid numeric data in line {line_num}: {e}")
+        return None
+    
+    if not product_data.get('id'):
+        print(f"Warning: Line {line_num} has no product id")
+        return None
+    
+    return {
+        'id': product_data['id'],
+        'name': product_data.get('name') or '',
+        'description': product_data.get('description') or '',
+        'price': price,
+        'currency': product_data.get('currency') or 'TL',
+        'image_url': product_data.get('image_url') or None,
+        'tags': _parse_csv_json_list(product_data.get('tags')),
+        'category': product_data.get('category') or '',
+        'subcategory': product_data.get('subcategory') or None,
+        'brand': product_data.get('brand') or None,
+        'stock': stock,
+        'rating': rating,
+        'review_count': review_count,
+        'common_queries': _parse_csv_json_list(product_data.get('common_queries'))
+    }
+
+def iter_ecommerce_products_from_csv(csv_path: Path = CSV_PATH):
+    """
+    CSV'deki ürünleri satır satır üret (dosya belleğe alınmaz).
+    İlk satır tablo başlığıysa ('ecommerce_products') atlanır, ardından sütun isimleri gelir.
+    """
+    with open(csv_path, 'r', encoding='utf-8', newline='') as file:
+        first_line = file.readline()
+        if CSV_DELIMITER in first_line:
+            file.seek(0)  # No title line, the first line is already the header
         
-        print(f"Successfully loaded {len(products)} products from CSV")
-        return products
+        reader = csv.reader(file, delimiter=CSV_DELIMITER)
+        headers = next(reader, None)
+        if not headers:
+            print("CSV file has insufficient data")
+            return
+        headers = [header.strip() for header in headers]
+        print(f"CSV Headers: {headers}")
         
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        return []
+        for values in reader:
+            if not values or not any(value.strip() for value in values):
+                continue
+            if len(values) != len(headers):
+                print(f"Warning: Line {reader.line_num} has {len(values)} values but expected {len(headers)}")
+                continue
+            product = _parse_csv_product(dict(zip(headers, values)), reader.line_num)
+            if product:
+                yield product
 
-def init_ecommerce_database_from_csv():
-    """Initialize the e-commerce database from CSV file"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
-    cursor = conn.cursor()
+def _product_content_hash(product: Dict[str, Any]) -> str:
+    """CSV kaynaklı alanların hash'i (görsel ve visual_representation dahil değil)"""
+    payload = json.dumps([product[field] for field in _CSV_PRODUCT_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# Only the CSV-sourced columns are written; image_hash / visual_representation survive reloads
+_UPSERT_ECOMMERCE_PRODUCT_SQL = f'''
+    INSERT INTO ecommerce_products ({', '.join(_CSV_PRODUCT_FIELDS)}, content_hash)
+    VALUES ({', '.join('?' * (len(_CSV_PRODUCT_FIELDS) + 1))})
+    ON CONFLICT(id) DO UPDATE SET
+        {', '.join(f'{field} = excluded.{field}' for field in _CSV_PRODUCT_FIELDS[1:])},
+        content_hash = excluded.content_hash
+'''
+
+def _upsert_ecommerce_products_chunk(cursor, products: List[Dict[str, Any]]) -> tuple:
+    """Bir chunk'ı upsert et; sadece hash'i değişen satırlar yazılır. (inserted, updated) döndürür"""
+    product_ids = [p['id'] for p in products]
+    placeholders = ', '.join('?' * len(product_ids))
+    cursor.execute(
+        f'SELECT id, content_hash FROM ecommerce_products WHERE id IN ({placeholders})',
+        product_ids
+    )
+    existing_hashes = dict(cursor.fetchall())
     
-    # Create e-commerce products table
+    changed = {}
+    for product in products:
+        content_hash = _product_content_hash(product)
+        if product['id'] in existing_hashes and existing_hashes[product['id']] == content_hash:
+            continue
+        changed[product['id']] = (product, content_hash)  # Later duplicates of an id win
+    
+    if changed:
+        cursor.executemany(_UPSERT_ECOMMERCE_PRODUCT_SQL, [(
+            p['id'], p['name'], p['description'], p['price'],
+            p['currency'], p['image_url'], json.dumps(p['tags']),
+            p['category'], p['subcategory'], p['brand'],
+            p['stock'], p['rating'], p['review_count'], json.dumps(p['common_queries']),
+            content_hash
+        ) for p, content_hash in changed.values()])
+    
+    inserted = sum(1 for product_id in changed if product_id not in existing_hashes)
+    return inserted, len(changed) - inserted
+
+def _count_products_missing_from_sync(cursor) -> tuple:
+    """(csv_sync_ids'de olmayan ürün sayısı, toplam ürün sayısı)"""
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ecommerce_products (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            description TEXT,
-            price REAL NOT NULL,
-            currency TEXT DEFAULT 'TL',
-            image_url TEXT,
-            tags TEXT,  -- JSON string
-            category TEXT,
-            subcategory TEXT,
-            brand TEXT,
-            stock INTEGER DEFAULT 0,
-            rating REAL,
-            review_count INTEGER,
-            common_queries TEXT,  -- JSON string for common search queries
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        SELECT COUNT(*) FILTER (WHERE id NOT IN (SELECT id FROM temp.csv_sync_ids)), COUNT(*)
+        FROM ecommerce_products
     ''')
+    return cursor.fetchone()
+
+def _delete_products_missing_from_sync(cursor) -> int:
+    """csv_sync_ids'de olmayan ürünleri sil"""
+    cursor.execute('DELETE FROM ecommerce_products WHERE id NOT IN (SELECT id FROM temp.csv_sync_ids)')
+    return cursor.rowcount
+
+def upsert_ecommerce_products_from_csv(csv_path: Path = CSV_PATH, chunk_size: int = CSV_CHUNK_SIZE,
+                                       delete_missing: bool = False, invalidate: bool = True,
+                                       max_delete_ratio: Optional[float] = None) -> Dict[str, int]:
+    """
+    CSV'yi akış halinde okuyup ürünleri id'ye göre upsert et.
+    Her chunk kendi transaction'ında yazılır; bellek kullanımı chunk boyutuyla sınırlıdır.
+    Tablo silinmez, değişmeyen satırlara dokunulmaz.
     
-    # Check if we already have products
-    cursor.execute('SELECT COUNT(*) FROM ecommerce_products')
-    if cursor.fetchone()[0] == 0:
-        print("Loading products from CSV...")
-        products = load_ecommerce_data_from_csv()
+    Args:
+        delete_missing: CSV'de artık olmayan ürünleri de sil (catalog sync)
+        invalidate: Değişiklik varsa catalog snapshot'ını geçersiz kıl. Snapshot'ı kendisi
+            oluşturup swap eden çağıranlar (catalog sync) False verir.
+        max_delete_ratio: delete_missing ile catalog'un bu oranından fazlası silinecekse
+            (ör. yarım kopyalanmış CSV) silme yapılmaz; silinmeyen ürün sayısı
+            stats['refused_deletes'] ile döner. Upsert edilen satırlar yazılmış kalır.
+    """
+    conn = get_connection(ECOMMERCE_DB_PATH)
+    stats = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'refused_deletes': 0}
+    
+    if delete_missing:
+        # Görülen id'ler bellekte değil, bağlantıya özel geçici tabloda tutulur
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS csv_sync_ids (id TEXT PRIMARY KEY)')
+        with conn:
+            conn.execute('DELETE FROM temp.csv_sync_ids')
+    
+    def flush(chunk):
+        with conn:
+            cursor = conn.cursor()
+            inserted, updated = _upsert_ecommerce_products_chunk(cursor, chunk)
+            if delete_missing:
+                cursor.executemany('INSERT OR IGNORE INTO temp.csv_sync_ids (id) VALUES (?)',
+                                   [(p['id'],) for p in chunk])
+        stats['inserted'] += inserted
+        stats['updated'] += updated
+        stats['unchanged'] += len(chunk) - inserted - updated
+    
+    chunk = []
+    for product in iter_ecommerce_products_from_csv(csv_path):
+        chunk.append(product)
+        stats['read'] += 1
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    
+    # Never treat an empty/unreadable file as "delete everything"
+    if delete_missing and stats['read']:
+        with conn:
+            cursor = conn.cursor()
+            missing, total = _count_products_missing_from_sync(cursor)
+            if max_delete_ratio is not None and total and missing / total > max_delete_ratio:
+                stats['refused_deletes'] = missing
+            else:
+                stats['deleted'] = _delete_products_missing_from_sync(cursor)
+    
+    changed = stats['inserted'] or stats['updated'] or stats['deleted']
+    if changed:
+        # Once per load, not per chunk
+        with conn:
+            _rebuild_category_queries(conn.cursor())
+    if invalidate and changed:
+        invalidate_catalog_snapshot()
+    return stats
+
+def init_ecommerce_database_from_csv():
+    """Initialize (or incrementally refresh) the e-commerce database from the CSV file"""
+    if CSV_PATH.exists():
+        print(f"Loading e-commerce data from CSV: {CSV_PATH}")
+        try:
+            stats = upsert_ecommerce_products_from_csv(CSV_PATH)
+        except (OSError, csv.Error, sqlite3.Error) as e:
+            print(f"Error loading CSV file: {e}")
+            stats = None
         
-        if products:
-            # Insert all products from CSV
-            cursor.executemany('''
-                INSERT INTO ecommerce_products (
-                    id, name, description, price, currency, image_url, tags,
-                    category, subcategory, brand, stock, rating, review_count, common_queries
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', [(
-                p['id'], p['name'], p['description'], p['price'],
-                p['currency'], p['image_url'], json.dumps(p['tags']),
-                p['category'], p['subcategory'], p['brand'],
-                p['stock'], p['rating'], p['review_count'], json.dumps(p['common_queries'])
-            ) for p in products])
-            
-            conn.commit()
-            print(f"Successfully inserted {len(products)} products into database")
-        else:
-            print("No products found in CSV, falling back to dummy data")
-            # CSV bulunamazsa eski dummy data'yı kullan
-            init_ecommerce_database()
+        if stats and stats['read']:
+            print(f"CSV load: {stats['read']} rows read, {stats['inserted']} inserted, "
+                  f"{stats['updated']} updated, {stats['unchanged']} unchanged")
             return
     else:
-        print("Database already contains products, skipping CSV load")
+        print(f"CSV file not found at {CSV_PATH}")
+    
+    # CSV bulunamazsa eski dummy data'yı kullan (tablo boşsa)
+    print("No products found in CSV, falling back to dummy data")
+    init_ecommerce_database()
     
-    conn.close()
+
+_SELECT_ECOMMERCE_PRODUCT_BY_ID_SQL = 'SELECT * FROM ecommerce_products WHERE id = ?'
 
 def get_ecommerce_product_by_id(product_id: str) -> dict:
     """Get ecommerce product by ID"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
+    conn = get_connection(ECOMMERCE_DB_PATH)
     cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM ecommerce_products WHERE id = ?', (product_id,))
+    cursor.execute(_SELECT_ECOMMERCE_PRODUCT_BY_ID_SQL, (product_id,))
     result = cursor.fetchone()
     
     if result:
@@ -684,170 +1130,246 @@ def get_ecommerce_product_by_id(product_id: str) -> dict:
             except:
                 product_dict['common_queries'] = []
         
-        conn.close()
         return product_dict
     
-    conn.close()
     return None
 
+def get_category_query_frequencies(category: str) -> List[tuple]:
+    """Kategorideki tekrarsız common_queries, (query, frequency) olarak sık kullanılandan aza"""
+    def compute():
+        return get_connection(ECOMMERCE_DB_PATH).execute(
+            'SELECT query, frequency FROM category_queries WHERE category = ? ORDER BY frequency DESC, query',
+            (category,)
+        ).fetchall()
+    return _cached_aggregate(f'category_queries:{category}', compute)
+
 def get_common_queries_by_category(category: str) -> List[str]:
-    """Get all common queries from products in the same category"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT common_queries FROM ecommerce_products WHERE category = ?', (category,))
-    results = cursor.fetchall()
-    conn.close()
-    
-    all_queries = []
-    for result in results:
-        if result[0]:
-            try:
-                queries = json.loads(result[0])
-                if isinstance(queries, list):
-                    all_queries.extend(queries)
-            except:
-                continue
-    
-    # Remove duplicates and return
-    return list(set(all_queries))
+    """Get all common queries from products in the same category (precomputed, most frequent first)"""
+    return [query for query, _ in get_category_query_frequencies(category)]
 
-def search_products_by_tags(search_tags: List[str], limit: int = 4, min_price: float = None, 
-                           max_price: float = None, category: str = None) -> List[EcommerceProduct]:
-    """Tag'lere göre ürün arama"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
+def _load_catalog_rows(categories: Optional[List[str]] = None) -> List[dict]:
+    """Snapshot için e-ticaret ürünlerini tek seferde oku (categories verilirse sadece o kategoriler)"""
+    conn = get_connection(ECOMMERCE_DB_PATH)
     cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
     
-    # Check if new columns exist
-    cursor.execute("PRAGMA table_info(ecommerce_products)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    # Base query with conditional columns
-    if 'image_base64' in columns and 'visual_representation' in columns:
-        query = '''
-            SELECT id, name, description, price, currency, image_url, tags, category, 
-                   subcategory, brand, stock, rating, review_count, common_queries,
-                   image_base64, visual_representation
-            FROM ecommerce_products 
-            WHERE stock > 0
-        '''
+    if categories is None:
+        cursor.execute(f'SELECT {CATALOG_SNAPSHOT_COLUMNS} FROM ecommerce_products')
     else:
-        query = '''
-            SELECT id, name, description, price, currency, image_url, tags, category, 
-                   subcategory, brand, stock, rating, review_count, common_queries
-            FROM ecommerce_products 
-            WHERE stock > 0
-        '''
-    params = []
-    
-    # Price filters
-    if min_price is not None:
-        query += ' AND price >= ?'
-        params.append(min_price)
+        placeholders = ','.join('?' * len(categories))
+        cursor.execute(
+            f'SELECT {CATALOG_SNAPSHOT_COLUMNS} FROM ecommerce_products WHERE category IN ({placeholders})',
+            list(categories)
+        )
+    return [dict(row) for row in cursor.fetchall()]
+
+def _refresh_catalog_snapshot_locked() -> CatalogSnapshot:
+    global _catalog_snapshot
+    snapshot = build_catalog_snapshot(_load_catalog_rows())
+    _catalog_snapshot = snapshot
+    print(f"Catalog snapshot loaded with {len(snapshot)} products")
+    return snapshot
+
+def refresh_catalog_snapshot() -> CatalogSnapshot:
+    """Catalog snapshot'ını veritabanından yeniden oluştur ve atomik olarak değiştir"""
+    with _catalog_lock:
+        return _refresh_catalog_snapshot_locked()
+
+def load_catalog_snapshot() -> tuple:
+    """
+    Yeni bir snapshot'ı kilit tutmadan, mevcut olanı değiştirmeden oluştur.
+    (snapshot, generation) döndürür; generation swap_catalog_snapshot'a verilir.
+    """
+    generation = _catalog_generation
+    return build_catalog_snapshot(_load_catalog_rows()), generation
+
+def swap_catalog_snapshot(snapshot: CatalogSnapshot, generation: int) -> bool:
+    """
+    Önceden oluşturulmuş snapshot'ı atomik olarak devreye al.
+    Oluşturma sırasında catalog'a başka bir yazma olduysa snapshot eskimiştir; bu durumda
+    sadece invalidate edilir ve bir sonraki okuma yeniden yükler.
+    """
+    global _catalog_snapshot
+    _clear_aggregate_cache()
+    with _catalog_lock:
+        if generation != _catalog_generation:
+            _catalog_snapshot = None
+            return False
+        _catalog_snapshot = snapshot
+    print(f"Catalog snapshot swapped in with {len(snapshot)} products")
+    return True
+
+def invalidate_catalog_snapshot():
+    """Catalog değiştiğinde snapshot'ı geçersiz kıl, bir sonraki okuma yeniden yükler"""
+    global _catalog_snapshot, _catalog_generation
+    _clear_aggregate_cache()
+    with _catalog_lock:
+        _catalog_snapshot = None
+        _catalog_generation += 1
+
+def get_catalog_snapshot() -> CatalogSnapshot:
+    """Güncel catalog snapshot'ını döndür (gerekirse yükle)"""
+    snapshot = _catalog_snapshot
+    if snapshot is not None:
+        return snapshot
+    with _catalog_lock:
+        if _catalog_snapshot is None:
+            return _refresh_catalog_snapshot_locked()
+        return _catalog_snapshot
+
+def search_products_by_tags(search_tags: List[str], limit: int = 4, min_price: float = None, 
+                           max_price: float = None, category: str = None,
+                           include_images: bool = True,
+                           diversity_seed: Optional[int] = None,
+                           categories: Optional[List[str]] = None) -> List[EcommerceProduct]:
+    """
+    Tag'lere göre ürün arama (bellekteki catalog snapshot üzerinde).
+    categories (ör. category router tahmini) verilirse sadece bu kategoriler skorlanır.
+    Sıralama deterministiktir ve sonuçlar catalog değişene kadar cache'lenir;
+    diversity_seed ile seed'li çeşitlendirme açılabilir.
+    Görseller sadece dönen ürünler için ve include_images=True ise okunur.
+    Sharded mod açıksa (CATALOG_SHARDS, bkz. app.catalog_shards) arama shard'lara dağıtılır.
+    """
+    from app.catalog_shards import get_sharded_catalog
+
+    snapshot = get_catalog_snapshot()
+    sharded = get_sharded_catalog(snapshot)
+    entries = (sharded or snapshot).search_by_tags(
+        search_tags,
+        limit=limit,
+        min_price=min_price,
+        max_price=max_price,
+        category=category,
+        diversity_seed=diversity_seed,
+        categories=categories
+    )
+    return _catalog_entries_to_products(entries, include_images)
+
+def search_products_by_tags_batch(queries: List[List[str]], limit: int = 4, min_price: float = None,
+                                 max_price: float = None, category: str = None, min_threshold: float = 0.1,
+                                 include_images: bool = True) -> List[List[EcommerceProduct]]:
+    """
+    Birden fazla tag listesini tek bir sparse matris çarpımıyla skorla (N ayrı arama yerine).
+    Her sorgu için en iyi `limit` ürün, similarity_score ile birlikte, sorgu sırasıyla döner.
+    """
+    from app.tag_vectors import score_tag_queries
+
+    snapshot = get_catalog_snapshot()
+    candidate_mask = snapshot.columns.filter_mask(min_price, max_price, category)
+    scored = score_tag_queries(queries, snapshot, candidate_mask, limit=limit, min_threshold=min_threshold)
+
+    products = iter(_catalog_entries_to_products([entry for results in scored for entry, _ in results],
+                                                 include_images))
+    batch_results = []
+    for results in scored:
+        query_products = []
+        for _, score in results:
+            product = next(products)
+            product.similarity_score = score
+            query_products.append(product)
+        batch_results.append(query_products)
+    return batch_results
+
+def search_products_by_vector(search_tags: List[str], limit: int = 40, probes: Optional[int] = None,
+                              max_candidates: Optional[int] = None,
+                              include_images: bool = True,
+                              categories: Optional[List[str]] = None) -> List[EcommerceProduct]:
+    """
+    ANN (LSH) indeksiyle aday üretimi: tag/açıklama vektörü sorguya en yakın stoktaki ürünler.
+    Birebir tag eşleşmesi gerekmez; similarity_score yaklaşık kosinüs benzerliğidir.
+    probes / max_candidates recall-gecikme dengesini ayarlar (None = app.ann_index varsayılanları).
+    categories verilirse sadece bu kategorilerdeki ürünler döner.
+    """
+    from app.ann_index import get_ann_index, ANN_PROBES, ANN_MAX_CANDIDATES
+
+    snapshot = get_catalog_snapshot()
+    max_candidates = max_candidates or ANN_MAX_CANDIDATES
+    matches = get_ann_index(snapshot).search(
+        search_tags,
+        limit=max_candidates,
+        probes=probes or ANN_PROBES,
+        max_candidates=max_candidates
+    )
     
-    if max_price is not None:
-        query += ' AND price <= ?'
-        params.append(max_price)
+    results = []
+    for product_id, score in matches:
+        entry = snapshot.get(product_id)
+        if entry is None or entry.stock <= 0:
+            continue
+        if categories and entry.category not in categories:
+            continue
+        results.append((entry, score))
+        if len(results) >= limit:
+            break
     
-    # Category filter
-    if category:
-        query += ' AND category = ?'
-        params.append(category)
+    products = _catalog_entries_to_products([entry for entry, _ in results], include_images)
+    for product, (_, score) in zip(products, results):
+        product.similarity_score = score
+    return products
+
+def find_products_by_common_query(text: str, limit: int = 4,
+                                  include_images: bool = True) -> List[EcommerceProduct]:
+    """
+    Kullanıcı metni bir ürünün common_queries'inden biriyle (Türkçe katlama + sıralı token'lar)
+    eşleşiyorsa catalog ürünlerini doğrudan döndür; LLM/agent adımlarına gerek kalmaz.
+    """
+    entries = get_catalog_snapshot().match_common_query(text, limit=limit)
+    return _catalog_entries_to_products(entries, include_images)
+
+_INSERT_SAVED_PRODUCT_SQL = '''
+    INSERT INTO products (id, urun_adi, urun_aciklama, urun_adi_en, 
+                        visual_representation, image_hash, tags, 
+                        confidence_score, category)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def save_products_to_db(products: List[dict]) -> List[str]:
+    """
+    Birden fazla ürün kartını tek transaction'da kaydet (tek commit / fsync).
+    Görseller, ürün satırları ve FTS indeksi executemany ile yazılır.
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    Returns:
+        Kaydedilen ürünlerin ID'leri (giriş sırasıyla)
+    """
+    if not products:
+        return []
     
-    # Calculate tag similarity and score products
-    products_with_scores = []
+    product_ids = [str(uuid.uuid4()) for _ in products]
+    blobs = [_decode_image_blob(product.get('image_base64')) for product in products]
     
-    for row in rows:
-        product_tags = json.loads(row[6]) if row[6] else []
-        
-        # Calculate similarity score (intersection of tags)
-        matching_tags = set(search_tags) & set(product_tags)
-        similarity_score = len(matching_tags) / max(len(search_tags), 1)
-        
-        # Boost score if multiple tags match
-        if len(matching_tags) >= 2:
-            similarity_score *= 1.5
-        
-        # Add slight random factor to avoid always same results
-        import random
-        similarity_score += random.uniform(0, 0.1)
-        
-        if similarity_score > 0:  # Only include products with at least one matching tag
-            common_queries = json.loads(row[13]) if row[13] else []
-            product = EcommerceProduct(
-                id=row[0],
-                name=row[1],
-                description=row[2],
-                price=row[3],
-                currency=row[4],
-                image_url=row[5],
-                tags=product_tags,
-                category=row[7],
-                subcategory=row[8],
-                brand=row[9],
-                stock=row[10],
-                rating=row[11],
-                review_count=row[12],
-                common_queries=common_queries,
-                image_base64=row[14] if len(row) > 14 else None,
-                visual_representation=row[15] if len(row) > 15 else None
-            )
-            products_with_scores.append((product, similarity_score))
+    conn = get_connection(DB_PATH)
+    with conn:
+        cursor = conn.cursor()
+        cursor.executemany(_INSERT_IMAGE_BLOB_SQL, [blob for blob in blobs if blob])
+        cursor.executemany(_INSERT_SAVED_PRODUCT_SQL, [(
+            product_id,
+            product.get('urun_adi'),
+            product.get('urun_aciklama'),
+            product.get('urun_adi_en'),
+            product.get('visual_representation'),
+            blob[0] if blob else None,
+            json.dumps(product.get('tags', [])),
+            product.get('confidence_score'),
+            product.get('category')
+        ) for product_id, product, blob in zip(product_ids, products, blobs)])
+        if _products_fts_enabled():
+            _index_saved_products_fts(cursor, [(
+                product_id,
+                product.get('urun_adi'),
+                product.get('urun_aciklama'),
+                product.get('visual_representation')
+            ) for product_id, product in zip(product_ids, products)])
     
-    # Sort by similarity score and return top results
-    products_with_scores.sort(key=lambda x: x[1], reverse=True)
-    return [product for product, score in products_with_scores[:limit]]
+    _clear_aggregate_cache()
+    return product_ids
 
 def save_product_to_db(product: dict) -> str:
     """Ürünü veritabanına kaydet"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    product_id = str(uuid.uuid4())
-    tags_json = json.dumps(product.get('tags', []))
-    
-    cursor.execute('''
-        INSERT INTO products (id, urun_adi, urun_aciklama, urun_adi_en, 
-                            visual_representation, image_base64, tags, 
-                            confidence_score, category)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        product_id,
-        product.get('urun_adi'),
-        product.get('urun_aciklama'),
-        product.get('urun_adi_en'),
-        product.get('visual_representation'),
-        product.get('image_base64'),
-        tags_json,
-        product.get('confidence_score'),
-        product.get('category')
-    ))
-    
-    conn.commit()
-    conn.close()
-    
-    return product_id
+    return save_products_to_db([product])[0]
 
-def get_products_from_db(limit: int = 10) -> List[dict]:
-    """Veritabanından ürünleri getir"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, urun_adi, urun_aciklama, urun_adi_en, 
-               visual_representation, image_base64, tags, 
-               confidence_score, category, created_at
-        FROM products 
-        ORDER BY created_at DESC 
-        LIMIT ?
-    ''', (limit,))
-    
-    rows = cursor.fetchall()
-    conn.close()
+def _saved_product_rows_to_dicts(rows) -> List[dict]:
+    """products satırlarını API formatına çevir, görselleri tek sorguda ekle"""
+    images = _load_images_base64(DB_PATH, [row[5] for row in rows])
     
     products = []
     for row in rows:
@@ -857,7 +1379,7 @@ def get_products_from_db(limit: int = 10) -> List[dict]:
             'urun_aciklama': row[2],
             'urun_adi_en': row[3],
             'visual_representation': row[4],
-            'image_base64': row[5],
+            'image_base64': images.get(row[5]),
             'tags': json.loads(row[6]) if row[6] else [],
             'confidence_score': row[7],
             'category': row[8],
@@ -867,15 +1389,57 @@ def get_products_from_db(limit: int = 10) -> List[dict]:
     
     return products
 
+def get_products_from_db(limit: int = 10) -> List[dict]:
+    """Veritabanından ürünleri getir"""
+    conn = get_connection(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute(f'''
+        SELECT {SAVED_PRODUCT_COLUMNS}
+        FROM products 
+        ORDER BY created_at DESC 
+        LIMIT ?
+    ''', (limit,))
+    
+    return _saved_product_rows_to_dicts(cursor.fetchall())
+
 def search_products_by_visual_description(query: str, limit: int = 10) -> List[dict]:
-    """Visual description'larda arama yap"""
-    conn = sqlite3.connect(DB_PATH)
+    """
+    Visual description, ürün adı ve açıklamada tam metin arama yap.
+    Sonuçlar bm25 ile sıralanır (ürün adı eşleşmeleri en yüksek ağırlıkta).
+    """
+    if not _products_fts_enabled():
+        return _search_products_by_visual_description_like(query, limit)
+    
+    match_expression = _fts_match_expression(query)
+    if match_expression is None:
+        return get_products_from_db(limit)
+    
+    conn = get_connection(DB_PATH)
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT id, urun_adi, urun_aciklama, urun_adi_en, 
-               visual_representation, image_base64, tags, 
-               confidence_score, category, created_at
+    cursor.execute(f'''
+        SELECT {SAVED_PRODUCT_COLUMNS}
+        FROM products
+        JOIN (
+            SELECT product_id, bm25(products_fts, 0.0, 10.0, 5.0, 1.0) AS rank
+            FROM products_fts
+            WHERE products_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ) AS hits ON hits.product_id = products.id
+        ORDER BY hits.rank
+    ''', (match_expression, limit))
+    
+    return _saved_product_rows_to_dicts(cursor.fetchall())
+
+def _search_products_by_visual_description_like(query: str, limit: int) -> List[dict]:
+    """FTS5 olmayan SQLite derlemeleri için LIKE tabanlı arama"""
+    conn = get_connection(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute(f'''
+        SELECT {SAVED_PRODUCT_COLUMNS}
         FROM products 
         WHERE visual_representation LIKE ? 
            OR urun_adi LIKE ? 
@@ -884,150 +1448,125 @@ def search_products_by_visual_description(query: str, limit: int = 10) -> List[d
         LIMIT ?
     ''', (f'%{query}%', f'%{query}%', f'%{query}%', limit))
     
-    rows = cursor.fetchall()
-    conn.close()
-    
-    products = []
-    for row in rows:
-        product = {
-            'id': row[0],
-            'urun_adi': row[1],
-            'urun_aciklama': row[2],
-            'urun_adi_en': row[3],
-            'visual_representation': row[4],
-            'image_base64': row[5],
-            'tags': json.loads(row[6]) if row[6] else [],
-            'confidence_score': row[7],
-            'category': row[8],
-            'created_at': row[9]
-        }
-        products.append(product)
-    
-    return products
+    return _saved_product_rows_to_dicts(cursor.fetchall())
 
-def get_all_ecommerce_products(limit: int = 20) -> List[EcommerceProduct]:
-    """Tüm e-ticaret ürünlerini getir"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
-    cursor = conn.cursor()
-    
-    # Check if new columns exist
-    cursor.execute("PRAGMA table_info(ecommerce_products)")
-    columns = [column[1] for column in cursor.fetchall()]
+# Listing order; must match idx_ecommerce_products_listing so keyset pages come straight from the index
+_LISTING_SORT_KEY = 'COALESCE(rating, 0), COALESCE(review_count, 0), id'
+
+def _encode_listing_cursor(rating, review_count, product_id: str) -> str:
+    """Son ürünün sıralama anahtarını opak bir cursor'a çevir"""
+    payload = json.dumps([rating or 0, review_count or 0, product_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+def _decode_listing_cursor(cursor: str) -> tuple:
+    try:
+        rating, review_count, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return rating, review_count, product_id
+
+def _ecommerce_row_to_product(row, images: Dict[str, str]) -> EcommerceProduct:
+    """ECOMMERCE_PRODUCT_COLUMNS sırasındaki satırı modele çevir"""
+    return EcommerceProduct(
+        id=row[0],
+        name=row[1],
+        description=row[2],
+        price=row[3],
+        currency=row[4],
+        image_url=row[5],
+        tags=json.loads(row[6]) if row[6] else [],
+        category=row[7],
+        subcategory=row[8],
+        brand=row[9],
+        stock=row[10],
+        rating=row[11],
+        review_count=row[12],
+        common_queries=json.loads(row[13]) if row[13] else [],
+        image_base64=images.get(row[14]),
+        visual_representation=row[15]
+    )
+
+def get_ecommerce_products_page(limit: int = 20, cursor: Optional[str] = None) -> tuple:
+    """
+    Stoktaki ürünleri rating/review_count sırasıyla sayfa sayfa getir (keyset pagination).
+    (ürünler, next_cursor) döndürür; son sayfada next_cursor None olur.
+    """
+    conn = get_connection(ECOMMERCE_DB_PATH)
     
-    if 'image_base64' in columns and 'visual_representation' in columns:
-        cursor.execute('''
-            SELECT id, name, description, price, currency, image_url, tags, category, 
-                   subcategory, brand, stock, rating, review_count, common_queries,
-                   image_base64, visual_representation
-            FROM ecommerce_products 
-            WHERE stock > 0
-            ORDER BY rating DESC, review_count DESC
-            LIMIT ?
-        ''', (limit,))
-    else:
-        cursor.execute('''
-            SELECT id, name, description, price, currency, image_url, tags, category, 
-                   subcategory, brand, stock, rating, review_count, common_queries
-            FROM ecommerce_products 
-            WHERE stock > 0
-            ORDER BY rating DESC, review_count DESC
-            LIMIT ?
-        ''', (limit,))
+    params = []
+    after_clause = ''
+    if cursor:
+        rating, review_count, product_id = _decode_listing_cursor(cursor)
+        # The leading rating bound lets SQLite seek into the index instead of scanning from the top
+        after_clause = f'AND COALESCE(rating, 0) <= ? AND ({_LISTING_SORT_KEY}) < (?, ?, ?)'
+        params.extend([rating, rating, review_count, product_id])
+    params.append(limit + 1)  # One extra row tells whether there is a next page
     
-    rows = cursor.fetchall()
-    conn.close()
+    rows = conn.execute(f'''
+        SELECT {ECOMMERCE_PRODUCT_COLUMNS}
+        FROM ecommerce_products 
+        WHERE stock > 0 {after_clause}
+        ORDER BY COALESCE(rating, 0) DESC, COALESCE(review_count, 0) DESC, id DESC
+        LIMIT ?
+    ''', params).fetchall()
     
-    products = []
-    for row in rows:
-        product = EcommerceProduct(
-            id=row[0],
-            name=row[1],
-            description=row[2],
-            price=row[3],
-            currency=row[4],
-            image_url=row[5],
-            tags=json.loads(row[6]) if row[6] else [],
-            category=row[7],
-            subcategory=row[8],
-            brand=row[9],
-            stock=row[10],
-            rating=row[11],
-            review_count=row[12],
-            common_queries=json.loads(row[13]) if row[13] else [],
-            image_base64=row[14] if len(row) > 14 else None,
-            visual_representation=row[15] if len(row) > 15 else None
-        )
-        products.append(product)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    images = _load_images_base64(ECOMMERCE_DB_PATH, [row[14] for row in rows])
+    products = [_ecommerce_row_to_product(row, images) for row in rows]
     
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = _encode_listing_cursor(last[11], last[12], last[0])
+    return products, next_cursor
+
+def get_all_ecommerce_products(limit: int = 20) -> List[EcommerceProduct]:
+    """Tüm e-ticaret ürünlerini getir (ilk sayfa)"""
+    products, _ = get_ecommerce_products_page(limit=limit)
     return products
 
 def update_product_image_base64(product_id: str, image_base64: str, visual_representation: str = None):
-    """Update product with generated image base64 data"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
+    """Update product with generated image (stored once in the image blob store)"""
+    conn = get_connection(ECOMMERCE_DB_PATH)
     cursor = conn.cursor()
     
-    # Add image_base64 column if it doesn't exist
-    cursor.execute("PRAGMA table_info(ecommerce_products)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    if 'image_base64' not in columns:
-        cursor.execute('ALTER TABLE ecommerce_products ADD COLUMN image_base64 TEXT')
-        print("Added image_base64 column to ecommerce_products table")
-    
-    if 'visual_representation' not in columns:
-        cursor.execute('ALTER TABLE ecommerce_products ADD COLUMN visual_representation TEXT')
-        print("Added visual_representation column to ecommerce_products table")
-    
-    # Update the product
-    if visual_representation:
-        cursor.execute('''
-            UPDATE ecommerce_products 
-            SET image_base64 = ?, visual_representation = ?
-            WHERE id = ?
-        ''', (image_base64, visual_representation, product_id))
-    else:
-        cursor.execute('''
-            UPDATE ecommerce_products 
-            SET image_base64 = ?
-            WHERE id = ?
-        ''', (image_base64, product_id))
-    
-    conn.commit()
-    conn.close()
+    with conn:
+        image_hash = _store_image_blob(cursor, image_base64)
+        if image_hash is None:
+            # Keep the product's current image instead of clearing it
+            raise ValueError(f"Could not decode generated image for product {product_id}")
+        
+        # Update the product
+        if visual_representation:
+            cursor.execute('''
+                UPDATE ecommerce_products 
+                SET image_hash = ?, visual_representation = ?
+                WHERE id = ?
+            ''', (image_hash, visual_representation, product_id))
+        else:
+            cursor.execute('''
+                UPDATE ecommerce_products 
+                SET image_hash = ?
+                WHERE id = ?
+            ''', (image_hash, product_id))
+    # No snapshot invalidation: image fields are not part of the snapshot (see _load_catalog_media)
 
 def get_all_ecommerce_products_for_image_generation() -> List[Dict[str, Any]]:
-    """Get all ecommerce products specifically for image generation processing"""
-    conn = sqlite3.connect(ECOMMERCE_DB_PATH)
+    """
+    Get all ecommerce products specifically for image generation processing.
+    Görsel verisi okunmaz; 'image_hash' doluysa ürünün görseli zaten vardır.
+    """
+    conn = get_connection(ECOMMERCE_DB_PATH)
     cursor = conn.cursor()
     
-    # Check if image_base64 column exists
-    cursor.execute("PRAGMA table_info(ecommerce_products)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    if 'image_base64' in columns and 'visual_representation' in columns:
-        cursor.execute('''
-            SELECT id, name, description, price, currency, image_url, tags, category, 
-                   subcategory, brand, stock, rating, review_count, image_base64, visual_representation
-            FROM ecommerce_products 
-            ORDER BY rating DESC, review_count DESC
-        ''')
-    elif 'image_base64' in columns:
-        cursor.execute('''
-            SELECT id, name, description, price, currency, image_url, tags, category, 
-                   subcategory, brand, stock, rating, review_count, image_base64, NULL as visual_representation
-            FROM ecommerce_products 
-            ORDER BY rating DESC, review_count DESC
-        ''')
-    else:
-        cursor.execute('''
-            SELECT id, name, description, price, currency, image_url, tags, category, 
-                   subcategory, brand, stock, rating, review_count, NULL as image_base64, NULL as visual_representation
-            FROM ecommerce_products 
-            ORDER BY rating DESC, review_count DESC
-        ''')
+    cursor.execute(f'''
+        SELECT {ECOMMERCE_PRODUCT_COLUMNS}
+        FROM ecommerce_products 
+        ORDER BY COALESCE(rating, 0) DESC, COALESCE(review_count, 0) DESC, id DESC
+    ''')
     
     rows = cursor.fetchall()
-    conn.close()
     
     products = []
     for row in rows:
@@ -1045,16 +1584,80 @@ def get_all_ecommerce_products_for_image_generation() -> List[Dict[str, Any]]:
             'stock': row[10],
             'rating': row[11],
             'review_count': row[12],
-            'image_base64': row[13] if len(row) > 13 else None,
-            'visual_representation': row[14] if len(row) > 14 else None
+            'image_hash': row[14],
+            'visual_representation': row[15]
         }
         products.append(product)
     
     return products
 
+def _cached_aggregate(key: str, compute):
+    """Aggregate sonucunu AGGREGATE_CACHE_TTL_SECONDS boyunca cache'le"""
+    now = time.monotonic()
+    cached = _aggregate_cache.get(key)
+    if cached is not None and now - cached[0] < AGGREGATE_CACHE_TTL_SECONDS:
+        return cached[1]
+    value = compute()
+    with _aggregate_cache_lock:
+        _aggregate_cache[key] = (now, value)
+    return value
+
+def _clear_aggregate_cache():
+    """Yazma işlemlerinden sonra aggregate cache'ini boşalt"""
+    with _aggregate_cache_lock:
+        _aggregate_cache.clear()
+
+def count_saved_products() -> int:
+    """Kaydedilmiş ürün kartı sayısı"""
+    def compute():
+        return get_connection(DB_PATH).execute('SELECT COUNT(*) FROM products').fetchone()[0]
+    return _cached_aggregate('saved_products_count', compute)
+
+def count_ecommerce_products(in_stock_only: bool = True) -> int:
+    """E-ticaret ürün sayısı (varsayılan: sadece stoktakiler, listeleme ile aynı)"""
+    def compute():
+        where = ' WHERE stock > 0' if in_stock_only else ''
+        return get_connection(ECOMMERCE_DB_PATH).execute(
+            f'SELECT COUNT(*) FROM ecommerce_products{where}'
+        ).fetchone()[0]
+    return _cached_aggregate(f'ecommerce_products_count:{in_stock_only}', compute)
+
+def get_category_stats() -> List[Dict[str, Any]]:
+    """
+    Kategori başına ürün sayısı, stoktaki ürün sayısı ve fiyat aralığı.
+    idx_ecommerce_products_category_price üzerinden tablo satırlarına dokunmadan hesaplanır.
+    """
+    def compute():
+        rows = get_connection(ECOMMERCE_DB_PATH).execute('''
+            SELECT category,
+                   COUNT(*),
+                   SUM(CASE WHEN stock > 0 THEN 1 ELSE 0 END),
+                   MIN(price),
+                   MAX(price)
+            FROM ecommerce_products
+            GROUP BY category
+            ORDER BY category
+        ''').fetchall()
+        return [{
+            'category': category,
+            'product_count': product_count,
+            'in_stock_count': in_stock_count,
+            'min_price': min_price,
+            'max_price': max_price
+        } for category, product_count, in_stock_count, min_price, max_price in rows]
+    return _cached_aggregate('category_stats', compute)
+
+def get_category_names() -> List[str]:
+    """Stokta ürünü olan kategoriler (alfabetik)"""
+    return [
+        stats['category'] for stats in get_category_stats()
+        if stats['category'] and stats['in_stock_count'] > 0
+    ]
+
 def initialize_all_databases():
     """Tüm veritabanlarını başlat"""
     print("Initializing databases...")
-    init_database()
+    migrate_databases()  # Şema tek seferde, versiyonlu olarak güncellenir
     init_ecommerce_database_from_csv()  # CSV'den yükle
+    refresh_catalog_snapshot()  # Arama için catalog'u belleğe al
     print("Databases initialized successfully!") 
\ No newline at end of file
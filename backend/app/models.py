@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class ExampleRequest(BaseModel):
@@ -53,14 +53,16 @@ class EcommerceProduct(BaseModel):
     common_queries: Optional[List[str]] = None
     image_base64: Optional[str] = None  # AI generated base64 image
     visual_representation: Optional[str] = None  # Visual description for image generation
+    similarity_score: Optional[float] = None  # Only set by scored (batch) searches
     
 class SearchRequest(BaseModel):
     """Arama isteği modeli"""
     tags: List[str]
-    limit: int = 4
+    limit: int = Field(4, ge=0)
     min_price: Optional[float] = None
     max_price: Optional[float] = None
     category: Optional[str] = None
+    diversity_seed: Optional[int] = Field(None, ge=0)  # None = deterministik sıralama
     
 class SearchResponse(BaseModel):
     """Arama sonucu modeli"""
@@ -68,6 +70,34 @@ class SearchResponse(BaseModel):
     total_found: int
     search_tags: List[str]
     execution_time: Optional[float] = None
+    next_cursor: Optional[str] = None  # Listing endpoint'inde sonraki sayfa için
+
+class BatchSearchRequest(BaseModel):
+    """Toplu arama isteği: birden fazla tag listesi, ortak filtreler"""
+    queries: List[List[str]]
+    limit: int = Field(4, ge=0)
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    category: Optional[str] = None
+    min_threshold: float = 0.1
+
+class BatchSearchResponse(BaseModel):
+    """Toplu arama sonucu (sorgu sırasıyla)"""
+    results: List[SearchResponse]
+    total_queries: int
+    execution_time: Optional[float] = None
+
+class AutocompleteSuggestion(BaseModel):
+    """Tek bir typeahead önerisi"""
+    text: str
+    kind: str  # 'product', 'tag' veya 'query'
+    product_id: Optional[str] = None  # Sadece kind == 'product' için
+
+class AutocompleteResponse(BaseModel):
+    """Typeahead sonucu (popülerliğe göre sıralı)"""
+    query: str
+    suggestions: List[AutocompleteSuggestion]
+    execution_time: Optional[float] = None
 
 # A/B Test models
 class ABTestRequest(BaseModel):
@@ -104,11 +134,13 @@ class ProductTextOnly(BaseModel):
     urun_aciklama: str
     urun_adi_en: str
     visual_representation: str
+    image_base64: Optional[str] = None  # Catalog kısayolundan gelen ürünlerde mevcut görsel
 
 class SuggestionsTextResponse(BaseModel):
     """İlk aşama: Sadece text response"""
     number_of_cards: int
     products: List[ProductTextOnly]
+    matched_query: Optional[str] = None  # Bilinen bir common query ile eşleştiyse (LLM atlandı)
 
 class SuggestionImagesRequest(BaseModel):
     """İkinci aşama: Image generation isteği"""
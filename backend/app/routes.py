@@ -9,7 +9,7 @@ from PIL import Image
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import warnings
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import time
 
 # Suppress the specific UserWarning from the Vertex AI SDK
@@ -25,20 +25,27 @@ from vertexai.preview.vision_models import ImageGenerationModel
 
 # Import agent module and models
 from app.agent import process_product_for_tags, run_tag_generation_with_visual, run_simple_tag_generation, generate_ab_test_suggestion
+from app.tag_vectors import get_tag_vector_model
+from app.ann_index import get_ann_index
+from app.autocomplete import autocomplete, get_autocomplete_index, AUTOCOMPLETE_DEFAULT_LIMIT
+from app.catalog_sync import get_catalog_sync
 from app.models import (ProductCard, ProductCollection, TagGenerationRequest, 
                        TagGenerationResponse, EcommerceProduct, SearchRequest, SearchResponse,
                        ABTestRequest, ABTestInfo, ABTestResponse, SuggestionsTextRequest,
                        SuggestionsTextResponse, SuggestionImagesRequest, SuggestionImagesResponse,
-                       ProductTextOnly)
+                       ProductTextOnly, BatchSearchRequest, BatchSearchResponse,
+                       AutocompleteSuggestion, AutocompleteResponse)
 
 # Import database functions
 from app.database import (
     initialize_all_databases, 
     search_products_by_tags,
-    save_product_to_db,
+    search_products_by_tags_batch,
+    save_products_to_db,
     get_products_from_db,
     search_products_by_visual_description,
-    get_all_ecommerce_products,
+    get_ecommerce_products_page,
+    find_products_by_common_query,
     get_all_ecommerce_products_for_image_generation,
     update_product_image_base64
 )
@@ -48,6 +55,15 @@ router = APIRouter()
 # Initialize databases on startup
 initialize_all_databases()
 
+# Load (or fit once) the catalog TF-IDF model used by cosine_similarity_search
+get_tag_vector_model()
+
+# Load (or build once) the ANN index used for candidate generation
+get_ann_index()
+
+# Build the typeahead prefix index so the first keystroke is already fast
+get_autocomplete_index()
+
 class DescriptionRequest(BaseModel):
     description: str
 
@@ -321,7 +337,8 @@ def search_ecommerce_products(req: SearchRequest):
             limit=req.limit,
             min_price=req.min_price,
             max_price=req.max_price,
-            category=req.category
+            category=req.category,
+            diversity_seed=req.diversity_seed
         )
         
         # Convert EcommerceProduct objects to dict format and use stored images
@@ -387,6 +404,40 @@ def search_ecommerce_products(req: SearchRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {e}")
 
+@router.post("/search_ecommerce_batch", response_model=BatchSearchResponse)
+def search_ecommerce_products_batch(req: BatchSearchRequest):
+    """
+    Birden fazla tag listesini tek istekte ara (ör. öneri kartlarının her biri + fallback tag'leri)
+    
+    Tüm sorgular catalog'a karşı tek bir sparse matris işlemiyle skorlanır.
+    Sonuçlar istekteki sorgu sırasıyla döner.
+    """
+    try:
+        start_time = time.time()
+        
+        batch_results = search_products_by_tags_batch(
+            queries=req.queries,
+            limit=req.limit,
+            min_price=req.min_price,
+            max_price=req.max_price,
+            category=req.category,
+            min_threshold=req.min_threshold
+        )
+        
+        results = [
+            SearchResponse(products=products, total_found=len(products), search_tags=tags)
+            for tags, products in zip(req.queries, batch_results)
+        ]
+        
+        return BatchSearchResponse(
+            results=results,
+            total_queries=len(results),
+            execution_time=time.time() - start_time
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch search failed: {e}")
+
 # A/B Test endpoints
 @router.post("/ab-tests/start", response_model=ABTestResponse)
 async def start_ab_test(req: ABTestRequest):
@@ -502,29 +553,47 @@ async def stop_ab_test(product_id: str):
         raise HTTPException(status_code=500, detail=f"A/B test durdurma hatası: {e}")
 
 @router.get("/ecommerce_products", response_model=SearchResponse)
-def get_all_ecommerce_products_endpoint(limit: int = 20):
+def get_all_ecommerce_products_endpoint(limit: int = 20, cursor: Optional[str] = None):
     """
-    Tüm e-ticaret ürünlerini getir
+    Tüm e-ticaret ürünlerini getir (keyset pagination)
     
     Args:
         limit: Maksimum ürün sayısı
+        cursor: Önceki sayfanın next_cursor değeri
         
     Returns:
-        Ürün listesi
+        Ürün listesi ve sonraki sayfa için next_cursor
     """
     try:
-        products = get_all_ecommerce_products(limit)
+        products, next_cursor = get_ecommerce_products_page(limit=limit, cursor=cursor)
         
         return SearchResponse(
             products=products,
             total_found=len(products),
             search_tags=[],
-            execution_time=0.0
+            execution_time=0.0,
+            next_cursor=next_cursor
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get products: {e}")
 
+@router.get("/autocomplete", response_model=AutocompleteResponse)
+def autocomplete_suggestions(q: str, limit: int = AUTOCOMPLETE_DEFAULT_LIMIT):
+    """
+    Kullanıcı yazarken öneriler: ürün isimleri, tag'ler ve common query'ler.
+    Tamamen bellekteki prefix indeksinden (SQLite veya LLM yok), popülerliğe göre sıralı.
+    """
+    start_time = time.time()
+    suggestions = autocomplete(q, limit=limit)
+    return AutocompleteResponse(
+        query=q,
+        suggestions=[AutocompleteSuggestion(**suggestion) for suggestion in suggestions],
+        execution_time=time.time() - start_time
+    )
+
 @router.post("/generate_tags_with_visual", response_model=TagGenerationResponse)
 async def generate_tags_with_visual(req: TagGenerationRequest):
     """
@@ -571,10 +640,8 @@ def save_products(req: SaveProductRequest):
         Success message with saved product IDs
     """
     try:
-        saved_ids = []
-        for product in req.products:
-            product_id = save_product_to_db(product)
-            saved_ids.append(product_id)
+        # All cards in one transaction (one commit instead of one per card)
+        saved_ids = save_products_to_db(req.products)
         
         return {
             "success": True, 
@@ -681,6 +748,25 @@ def generate_tags(req: ProductTagRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Tag generation failed: {e}")
 
+def _similar_product_card(product_dict: dict) -> dict:
+    """/similar_products kart formatı (veritabanındaki image_base64 kullanılır)"""
+    return {
+        "urun_adi": product_dict['name'],
+        "urun_aciklama": product_dict['description'],
+        "urun_adi_en": product_dict['name'],  # Using same name for English
+        "visual_representation": product_dict.get('visual_representation') or f"A product image of {product_dict['name']}",
+        "image_base64": product_dict.get('image_base64'),  # Use stored image_base64 from database
+        "price": product_dict['price'],
+        "currency": product_dict['currency'],
+        "brand": product_dict['brand'],
+        "category": product_dict['category'],
+        "tags": product_dict['tags'],
+        "rating": product_dict.get('rating'),
+        "review_count": product_dict.get('review_count'),
+        "subcategory": product_dict.get('subcategory'),
+        "similarity_score": product_dict.get('similarity_score') or 0
+    }
+
 @router.post("/similar_products")
 async def get_similar_products(req: ProductTagRequest):
     """
@@ -693,6 +779,22 @@ async def get_similar_products(req: ProductTagRequest):
         Similar products from the database
     """
     try:
+        # Shortcut: the product name is a known catalog query -> no LLM / agent round-trip
+        from app.async_database import find_products_by_common_query_async
+        query_text = req.product.get('urun_adi') or ''
+        shortcut_products = await find_products_by_common_query_async(query_text, limit=8) if query_text else []
+        if shortcut_products:
+            print(f"⚡ [SIMILAR_PRODUCTS] '{query_text}' matched a common query, {len(shortcut_products)} catalog products")
+            similar_products_data = [product.model_dump() for product in shortcut_products]
+            tags = list(dict.fromkeys(tag for product in shortcut_products for tag in product.tags))
+            return {
+                "success": True,
+                "number_of_cards": len(similar_products_data),
+                "products": [_similar_product_card(product_dict) for product_dict in similar_products_data],
+                "generated_tags": tags,
+                "matched_query": query_text
+            }
+        
         print("🔍 [SIMILAR_PRODUCTS] Starting AI tag generation...")
         
         # Use AI tag generation instead of simple heuristic tags
@@ -729,25 +831,7 @@ async def get_similar_products(req: ProductTagRequest):
         # similar_products_data = similar_products_data[:4]
         
         # Convert to the expected format and use stored images
-        products_data = []
-        for product_dict in similar_products_data:
-            product_data = {
-                "urun_adi": product_dict['name'],
-                "urun_aciklama": product_dict['description'],
-                "urun_adi_en": product_dict['name'],  # Using same name for English
-                "visual_representation": product_dict.get('visual_representation', f"A product image of {product_dict['name']}"),
-                "image_base64": product_dict.get('image_base64'),  # Use stored image_base64 from database
-                "price": product_dict['price'],
-                "currency": product_dict['currency'],
-                "brand": product_dict['brand'],
-                "category": product_dict['category'],
-                "tags": product_dict['tags'],
-                "rating": product_dict.get('rating'),
-                "review_count": product_dict.get('review_count'),
-                "subcategory": product_dict.get('subcategory'),
-                "similarity_score": product_dict.get('similarity_score', 0)
-            }
-            products_data.append(product_data)
+        products_data = [_similar_product_card(product_dict) for product_dict in similar_products_data]
         
         return {
             "success": True,
@@ -764,7 +848,26 @@ def generate_suggestions_text(req: SuggestionsTextRequest):
     """
     İlk aşama: Kullanıcı açıklamasından hızlı text-only ürün önerileri oluştur
     Bu endpoint sadece LLM text generation yapar, image generation yapmaz (hızlı)
+    Açıklama bilinen bir common query ise catalog ürünleri LLM çağrısı olmadan döner.
     """
+    # --- Shortcut: known catalog query ---
+    catalog_products = find_products_by_common_query(req.description, limit=4)
+    if catalog_products:
+        print(f"[TEXT_ONLY] '{req.description}' matched a common query, {len(catalog_products)} catalog products")
+        return SuggestionsTextResponse(
+            number_of_cards=len(catalog_products),
+            products=[
+                ProductTextOnly(
+                    urun_adi=p.name,
+                    urun_aciklama=p.description,
+                    urun_adi_en=p.name,
+                    visual_representation=p.visual_representation or f"A product image of {p.name}",
+                    image_base64=p.image_base64
+                ) for p in catalog_products
+            ],
+            matched_query=req.description
+        )
+
     # --- Environment Variable Checks ---
     api_key = os.getenv("GEMINI_API_KEY")
     
@@ -838,7 +941,23 @@ def generate_suggestion_images(req: SuggestionImagesRequest):
     """
     İkinci aşama: Text-only ürün listesini alıp sadece image generation yapar
     Bu endpoint yavaş çünkü concurrent image generation işlemi yapar
+    Görseli zaten olan ürünler (catalog kısayolu) olduğu gibi döner.
     """
+    # Catalog kısayolundan gelen kartlar: üretilecek görsel yok
+    if req.products and all(p.image_base64 for p in req.products):
+        return SuggestionImagesResponse(
+            number_of_cards=len(req.products),
+            products=[
+                ProductCard(
+                    urun_adi=p.urun_adi,
+                    urun_aciklama=p.urun_aciklama,
+                    urun_adi_en=p.urun_adi_en,
+                    visual_representation=p.visual_representation,
+                    image_base64=p.image_base64
+                ) for p in req.products
+            ]
+        )
+
     # --- Environment Variable Checks ---
     project_id = os.getenv("GCP_PROJECT_ID")
     location = os.getenv("GCP_REGION")
@@ -861,7 +980,7 @@ def generate_suggestion_images(req: SuggestionImagesRequest):
                 "urun_aciklama": p.urun_aciklama,
                 "urun_adi_en": p.urun_adi_en,
                 "visual_representation": p.visual_representation,
-                "image_base64": None  # Will be populated by image generation
+                "image_base64": p.image_base64  # Populated by image generation if missing
             }
             products_dict.append(product_dict)
 
@@ -870,10 +989,12 @@ def generate_suggestion_images(req: SuggestionImagesRequest):
         # --- Concurrent Image Generation ---
         with ThreadPoolExecutor(max_workers=4) as executor:
             # Submit all image generation tasks to the thread pool
-            future_to_product = {executor.submit(generate_and_encode_image, p): p for p in products_dict}
+            future_to_product = {
+                executor.submit(generate_and_encode_image, p): p for p in products_dict if not p['image_base64']
+            }
             
             # Collect results as they complete
-            updated_products = []
+            updated_products = [p for p in products_dict if p['image_base64']]
             for future in as_completed(future_to_product):
                 try:
                     updated_product = future.result()
@@ -1073,7 +1194,7 @@ def generate_images_for_database_products():
         # Filter products that don't already have images
         products_without_images = [
             p for p in products 
-            if not p.get('image_base64') or p.get('image_base64') is None
+            if not p.get('image_hash')
         ]
         
         if not products_without_images:
@@ -1142,4 +1263,28 @@ def generate_images_for_database_products():
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database image generation failed: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database image generation failed: {e}")
+
+# Catalog admin endpoints
+@router.post("/admin/catalog/reload")
+def reload_catalog(force: bool = True):
+    """
+    Catalog CSV'sini arka planda yeniden yükle (diff uygulanır, arama yapıları atomik değişir)
+    
+    Not: Bu endpoint kimlik doğrulaması yapmaz; yalnızca iç ağdan erişilebilir olmalı.
+    
+    Args:
+        force: CSV değişmemiş görünse bile yeniden yükle
+    """
+    catalog_sync = get_catalog_sync()
+    started = catalog_sync.trigger(force=force)
+    return {
+        "started": started,
+        "message": "Catalog sync started" if started else "A catalog sync is already running",
+        "status": catalog_sync.status
+    }
+
+@router.get("/admin/catalog/status")
+def get_catalog_sync_status():
+    """Son catalog sync'inin durumu"""
+    return get_catalog_sync().status
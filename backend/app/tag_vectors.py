@@ -0,0 +1,323 @@
+"""
+Pre-fitted TF-IDF model over catalog product tags.
+The character n-gram vectorizer and the product matrix are fitted once over the
+whole catalog, persisted to disk and reloaded at startup, so a search only has
+to transform the query and take one sparse dot product.
+
+Tags are compared in their canonical form (app.text_normalization.canonical_tag).
+Per product, the query tags it carries are matched exactly by interned id and only
+the ones it lacks (its leftovers) are scored with fuzzy TF-IDF similarity, so a
+product without any exact match still ranks by similarity to the whole query.
+"""
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.catalog import CatalogSnapshot, TAG_VOCABULARY
+from app.database import get_catalog_snapshot
+from app.text_normalization import canonical_tag
+
+MODEL_PATH = Path(__file__).parent / "output" / "tag_tfidf.joblib"
+MODEL_PATH.parent.mkdir(exist_ok=True)
+
+# Models by catalog fingerprint. The previous one is kept so that requests still holding the
+# old snapshot during a catalog swap do not force a refit.
+MODEL_CACHE_SIZE = 2
+_models: "OrderedDict[str, TagVectorModel]" = OrderedDict()
+_model_lock = threading.Lock()
+
+
+def _parse_tags(tags) -> List[str]:
+    if isinstance(tags, str):
+        return json.loads(tags) if tags else []
+    return tags or []
+
+
+def product_tag_text(tags) -> str:
+    """Tag'leri (kanonik biçimde) vectorizer'ın beklediği tek metne çevir"""
+    return ' '.join(canonical_tag(tag) for tag in _parse_tags(tags))
+
+
+def canonical_query_tags(search_tags: List[str]) -> List[str]:
+    """Sorgu tag'lerinin kanonik biçimi (sıra korunur, tekrarsız)"""
+    return list(dict.fromkeys(tag for tag in map(canonical_tag, search_tags) if tag))
+
+
+def leftover_text(query_tags: List[str], matched) -> str:
+    """Ürünün birebir eşleşmediği sorgu tag'leri, vectorizer'ın beklediği tek metin olarak"""
+    return ' '.join(tag for tag, hit in zip(query_tags, matched) if not hit)
+
+
+def combine_tag_scores(exact_counts, fuzzy_scores, query_size):
+    """
+    Birebir eşleşen her tag tam puan, ürünün eşleşmediği (leftover) tag'ler ise o tag'lerin
+    TF-IDF benzerliği kadar puan alır; sorgu boyutuna bölünür ve birebir eşleşme başına %30
+    artırılır (skaler veya NumPy dizileri). Hiç eşleşmesi olmayan üründe skor, tüm sorgunun
+    TF-IDF benzerliğidir.
+    """
+    leftover_counts = query_size - exact_counts
+    coverage = (exact_counts + leftover_counts * fuzzy_scores) / np.maximum(query_size, 1)
+    return coverage * (1.0 + 0.3 * exact_counts)
+
+
+def _create_vectorizer() -> TfidfVectorizer:
+    # Use character n-grams to catch partial matches like bluetooth_kulaklık vs kulaklık_bluetooth
+    return TfidfVectorizer(
+        analyzer='char_wb',  # Character-based with word boundaries
+        ngram_range=(3, 8),  # N-gram range for character analysis
+        lowercase=True,
+        max_features=10000,
+        min_df=1  # Include terms that appear in at least 1 document
+    )
+
+
+class TagVectorModel:
+    """Fitted vectorizer + L2-normalized product tag matrix (one row per catalog product)"""
+
+    def __init__(self, vectorizer: TfidfVectorizer, matrix: sparse.csr_matrix,
+                 product_ids: List[str], fingerprint: str):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.product_ids = product_ids
+        self.fingerprint = fingerprint
+        self.row_by_id = {product_id: row for row, product_id in enumerate(product_ids)}
+
+    def transform(self, texts: List[str]) -> sparse.csr_matrix:
+        return self.vectorizer.transform(texts)
+
+    def vectors_for(self, product_data: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        """
+        Ürünlerin önceden hesaplanmış satırlarını döndür.
+        Catalog'da olmayan ürünler (ör. MCP'den gelen eski veri) anında transform edilir.
+        """
+        rows = [self.row_by_id.get(product.get('id')) for product in product_data]
+        if all(row is not None for row in rows):
+            return self.matrix[rows]
+
+        vectors = []
+        for product, row in zip(product_data, rows):
+            if row is not None:
+                vectors.append(self.matrix[row])
+            else:
+                vectors.append(self.transform([product_tag_text(product.get('tags', []))]))
+        return sparse.vstack(vectors, format='csr')
+
+    def matrix_for(self, entries) -> sparse.csr_matrix:
+        """Catalog entry sırasına hizalanmış ürün matrisi (diskten yüklenen modelde sıra farklı olabilir)"""
+        product_ids = [entry.id for entry in entries]
+        if product_ids == self.product_ids:
+            return self.matrix
+        return self.matrix[[self.row_by_id[product_id] for product_id in product_ids]]
+
+
+def tag_match_matrix(query_tags: List[str], product_data: List[Dict[str, Any]],
+                     snapshot: CatalogSnapshot) -> np.ndarray:
+    """
+    (ürün x sorgu tag'i) birebir eşleşme matrisi; query_tags kanonik olmalı.
+    Catalog ürünlerinde interned tag id'leri, catalog dışı ürünlerde (ör. MCP'den gelen
+    eski veri) kanonik string'ler karşılaştırılır.
+    """
+    query_tag_ids = []
+    for tag in query_tags:
+        tag_ids = TAG_VOCABULARY.lookup([tag])
+        query_tag_ids.append(tag_ids[0] if tag_ids else -1)
+
+    matched = np.zeros((len(product_data), len(query_tags)), dtype=bool)
+    for i, product in enumerate(product_data):
+        position = snapshot.positions.get(product.get('id'))
+        if position is not None:
+            matched[i] = np.isin(query_tag_ids, snapshot.columns.tag_ids_at(position))
+        else:
+            product_tags = {canonical_tag(tag) for tag in _parse_tags(product.get('tags', []))}
+            matched[i] = [tag in product_tags for tag in query_tags]
+    return matched
+
+
+def leftover_similarities(model: TagVectorModel, product_vectors: sparse.csr_matrix,
+                          query_tags: List[str], matched: np.ndarray) -> np.ndarray:
+    """
+    Her ürünün kendi leftover tag'leriyle TF-IDF benzerliği.
+    Eşleşmesi olmayan ürünler (çoğunluk) tüm sorgunun tek vektörünü paylaşır; en az bir tag'i
+    eşleşenler eşleşme desenine göre gruplanır, desen başına bir sorgu vektörü.
+    """
+    similarities = np.asarray((product_vectors @ model.transform([' '.join(query_tags)]).T).todense()).ravel()
+
+    hit_rows = np.flatnonzero(matched.any(axis=1))
+    if len(hit_rows):
+        patterns, pattern_of_row = np.unique(matched[hit_rows], axis=0, return_inverse=True)
+        pattern_vectors = model.transform([leftover_text(query_tags, pattern) for pattern in patterns])
+        hit_similarities = (product_vectors[hit_rows] @ pattern_vectors.T).tocsr()
+        similarities[hit_rows] = np.asarray(
+            hit_similarities[np.arange(len(hit_rows)), pattern_of_row.ravel()]
+        ).ravel()
+    return similarities
+
+
+def tag_match_scores(search_tags: List[str], product_data: List[Dict[str, Any]],
+                     snapshot: CatalogSnapshot = None) -> np.ndarray:
+    """
+    Sorgu ile her ürün arasındaki tag skoru (bkz. combine_tag_scores).
+    Birebir eşleşmeler hash lookup ile, her ürünün leftover tag'leri TF-IDF ile skorlanır.
+    """
+    if snapshot is None:
+        snapshot = get_catalog_snapshot()
+    query_tags = canonical_query_tags(search_tags)
+    if not query_tags or not product_data:
+        return np.zeros(len(product_data))
+
+    matched = tag_match_matrix(query_tags, product_data, snapshot)
+    model = get_tag_vector_model(snapshot)
+    fuzzy_scores = leftover_similarities(model, model.vectors_for(product_data), query_tags, matched)
+    return combine_tag_scores(matched.sum(axis=1), fuzzy_scores, len(query_tags))
+
+
+def score_tag_queries(tag_lists: List[List[str]], snapshot: CatalogSnapshot, candidate_mask: np.ndarray,
+                      limit: int = 4, min_threshold: float = 0.1) -> List[List[tuple]]:
+    """
+    Birden fazla tag listesini catalog'a karşı tek seferde skorla (sorgu başına döngü yok).
+    Skor cosine_similarity_search ile aynı (tag_match_scores / combine_tag_scores); sadece
+    filtreden geçen (candidate_mask) ürünler skorlanır ve tüm ara sonuçlar sparse kalır.
+    Her sorgu için (entry, score) listesi döndürür, en iyi `limit` sonuç; eşit skorda
+    yorum sayısı, puan ve id sırası (tek sorgulu aramayla aynı).
+    """
+    query_tag_lists = [canonical_query_tags(search_tags) for search_tags in tag_lists]
+    candidates = np.flatnonzero(candidate_mask)
+    results = [[] for _ in tag_lists]
+    if limit <= 0 or len(candidates) == 0 or not any(query_tag_lists):
+        return results
+
+    columns = snapshot.columns
+    model = get_tag_vector_model(snapshot)
+    product_vectors = model.matrix_for(snapshot.entries)[candidates]
+    num_candidates = len(candidates)
+    query_sizes = np.array([len(query_tags) for query_tags in query_tag_lists], dtype=np.int64)
+
+    # Whole-query similarity for every (candidate, query) pair: one sparse product
+    query_vectors = model.transform([' '.join(query_tags) for query_tags in query_tag_lists])
+    full = (product_vectors @ query_vectors.T).tocoo()
+    full_keys = full.col.astype(np.int64) * num_candidates + full.row
+
+    # Exact matches: one row per (query, tag) slot times the candidates' tag rows
+    slot_tags = [[tag] for query_tags in query_tag_lists for tag in query_tags]
+    slot_queries = np.repeat(np.arange(len(query_tag_lists)), query_sizes)
+    slot_offsets = np.concatenate(([0], np.cumsum(query_sizes)[:-1]))
+    hits = (columns.query_tag_matrix(slot_tags) @ columns.tag_matrix[candidates].T).tocoo()
+    hit_queries = slot_queries[hits.row]
+    hit_keys, pair_of_hit = np.unique(hit_queries * num_candidates + hits.col, return_inverse=True)
+
+    # Products with exact hits score their own leftover tags; group them by (query, match pattern)
+    matched = np.zeros((len(hit_keys), int(query_sizes.max())), dtype=bool)
+    matched[pair_of_hit.ravel(), hits.row - slot_offsets[hit_queries]] = True
+    hit_similarities = np.zeros(len(hit_keys))
+    if len(hit_keys):
+        patterns, pattern_of_pair = np.unique(np.column_stack((hit_keys // num_candidates, matched)), axis=0,
+                                              return_inverse=True)
+        pattern_vectors = model.transform([
+            leftover_text(query_tag_lists[pattern[0]], pattern[1:]) for pattern in patterns
+        ])
+        hit_similarities = np.asarray(
+            product_vectors[hit_keys % num_candidates].multiply(pattern_vectors[pattern_of_pair.ravel()]).sum(axis=1)
+        ).ravel()
+
+    keys = np.union1d(full_keys, hit_keys)
+    fuzzy_scores = np.zeros(len(keys))
+    fuzzy_scores[np.searchsorted(keys, full_keys)] = full.data
+    exact_counts = np.zeros(len(keys), dtype=np.int64)
+    hit_rows = np.searchsorted(keys, hit_keys)
+    fuzzy_scores[hit_rows] = hit_similarities
+    exact_counts[hit_rows] = matched.sum(axis=1)
+
+    pair_queries = keys // num_candidates
+    scores = combine_tag_scores(exact_counts, fuzzy_scores, query_sizes[pair_queries])
+    keep = scores > min_threshold
+    pair_queries, scores = pair_queries[keep], scores[keep]
+    positions = candidates[keys[keep] % num_candidates]
+
+    # Per query: score desc, then like CatalogSnapshot.score_by_tags; first `limit` of each query
+    order = np.lexsort((
+        columns.id_ranks[positions],
+        -columns.ratings[positions],
+        -columns.review_counts[positions],
+        -scores,
+        pair_queries,
+    ))
+    pair_queries, positions, scores = pair_queries[order], positions[order], scores[order]
+    top = np.arange(len(order)) - np.searchsorted(pair_queries, pair_queries) < limit
+    for query_index, position, score in zip(pair_queries[top], positions[top], scores[top]):
+        results[query_index].append((snapshot.entries[position], float(score)))
+    return results
+
+
+def fit_tag_vector_model(snapshot: CatalogSnapshot) -> TagVectorModel:
+    """Vectorizer'ı tüm catalog üzerinde fit et"""
+    product_ids = [entry.id for entry in snapshot.entries]
+    texts = [product_tag_text(list(entry.tags)) for entry in snapshot.entries]
+
+    vectorizer = _create_vectorizer()
+    matrix = vectorizer.fit_transform(texts).tocsr()
+    print(f"🔢 Fitted tag TF-IDF model on {len(product_ids)} products ({matrix.shape[1]} features)")
+    return TagVectorModel(vectorizer, matrix, product_ids, snapshot.tag_fingerprint)
+
+
+def save_tag_vector_model(model: TagVectorModel, path: Path = MODEL_PATH):
+    """Modeli diske yaz (önce geçici dosyaya, sonra atomik rename)"""
+    tmp_path = path.with_suffix('.tmp')
+    joblib.dump({
+        'vectorizer': model.vectorizer,
+        'matrix': model.matrix,
+        'product_ids': model.product_ids,
+        'fingerprint': model.fingerprint,
+    }, tmp_path)
+    tmp_path.replace(path)
+
+
+def load_tag_vector_model(path: Path = MODEL_PATH) -> Optional[TagVectorModel]:
+    """Diskteki modeli yükle, yoksa veya okunamıyorsa None döndür"""
+    if not path.exists():
+        return None
+    try:
+        data = joblib.load(path)
+        return TagVectorModel(data['vectorizer'], data['matrix'], data['product_ids'], data['fingerprint'])
+    except Exception as e:
+        print(f"⚠️ Could not load tag TF-IDF model from {path}: {e}")
+        return None
+
+
+def get_tag_vector_model(snapshot: CatalogSnapshot = None) -> TagVectorModel:
+    """
+    Verilen (varsayılan: güncel) catalog snapshot'ına ait modeli döndür.
+    Diskteki model catalog ile eşleşiyorsa yüklenir, değilse yeniden fit edilip kaydedilir.
+    """
+    if snapshot is None:
+        snapshot = get_catalog_snapshot()
+
+    model = _models.get(snapshot.tag_fingerprint)
+    if model is not None:
+        return model
+
+    with _model_lock:
+        model = _models.get(snapshot.tag_fingerprint)
+        if model is not None:
+            return model
+
+        model = load_tag_vector_model()
+        if model is None or model.fingerprint != snapshot.tag_fingerprint:
+            model = fit_tag_vector_model(snapshot)
+            try:
+                save_tag_vector_model(model)
+            except OSError as e:
+                print(f"⚠️ Could not persist tag TF-IDF model: {e}")
+        else:
+            print(f"🔢 Loaded tag TF-IDF model for {len(model.product_ids)} products from disk")
+
+        _models[model.fingerprint] = model
+        while len(_models) > MODEL_CACHE_SIZE:
+            _models.popitem(last=False)
+        return model
@@ -0,0 +1,48 @@
+"""
+Text normalization helpers for Turkish search text.
+Shared by the full-text index, query lookups and tag matching so that
+'kulaklık', 'KULAKLIK' and 'kulaklik' all end up as the same token.
+"""
+import re
+import unicodedata
+from typing import List
+
+# Türkçe'ye özgü harfleri ASCII karşılıklarına katla (ı/İ -> i, ş -> s, ğ -> g ...)
+_TURKISH_FOLD_TABLE = str.maketrans({
+    'ı': 'i', 'İ': 'i', 'I': 'i',
+    'ş': 's', 'Ş': 's',
+    'ğ': 'g', 'Ğ': 'g',
+    'ç': 'c', 'Ç': 'c',
+    'ö': 'o', 'Ö': 'o',
+    'ü': 'u', 'Ü': 'u',
+})
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def fold_turkish(text: str) -> str:
+    """Türkçe-duyarlı küçük harfe çevirme + aksan katlama ('Kulaklık Şarj' -> 'kulaklik sarj')"""
+    if not text:
+        return ''
+    text = text.translate(_TURKISH_FOLD_TABLE)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.lower()
+
+
+def search_tokens(text: str) -> List[str]:
+    """Katlanmış metni alfanümerik token'lara ayır"""
+    return _TOKEN_PATTERN.findall(fold_turkish(text))
+
+
+def canonical_tag(tag: str) -> str:
+    """
+    Tag'in kanonik biçimi: katlanmış, tekrarsız ve sıralı '_' token'ları.
+    'kulaklık_bluetooth', 'Bluetooth_Kulaklık' ve 'bluetooth_kulaklik' -> 'bluetooth_kulaklik'
+    """
+    return '_'.join(sorted(set(search_tokens(tag))))
+
+
+def normalize_query(text: str) -> str:
+    """Sorgu anahtarı: katlanmış, sıralı token'lar ('Yan Sehpa C' ve 'c yan sehpa' -> 'c sehpa yan')"""
+    return ' '.join(sorted(search_tokens(text)))
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from app.routes import router
+from app.catalog_sync import start_catalog_sync
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -16,3 +17,9 @@ app.add_middleware(
 )
 
 app.include_router(router)
+
+@app.on_event("startup")
+def start_catalog_watcher():
+    # Pick up catalog CSV updates in the background, no restart needed.
+    # Only the API process watches the CSV; MCP server processes just read the database.
+    start_catalog_sync()
@@ -16,10 +16,16 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from app.database import (
     initialize_all_databases,
     search_products_by_tags,
+    search_products_by_tags_batch,
     save_product_to_db,
+    save_products_to_db,
     get_products_from_db,
     search_products_by_visual_description,
-    get_all_ecommerce_products
+    get_ecommerce_products_page,
+    count_saved_products,
+    count_ecommerce_products,
+    get_category_stats,
+    get_category_names
 )
 from app.models import EcommerceProduct
 
@@ -39,6 +45,7 @@ print("✅ MCP Server instance created")
 # Initialize databases
 print("🗄️ Initializing databases...")
 initialize_all_databases()
+# No CSV watcher here: this process is spawned per agent search; the API process owns catalog sync
 print("✅ Databases initialized successfully")
 
 @mcp.tool
@@ -71,17 +78,47 @@ def search_ecommerce_products_by_tags(
     return result
 
 @mcp.tool
-def get_all_ecommerce_products_list(
-    limit: int = Field(default=20, description="Maximum number of products to return")
-) -> List[EcommerceProduct]:
+def search_ecommerce_products_by_tags_batch(
+    queries: List[List[str]] = Field(description="List of tag lists, one per search"),
+    limit: int = Field(default=4, description="Maximum number of products to return per search"),
+    min_price: Optional[float] = Field(default=None, description="Minimum price filter"),
+    max_price: Optional[float] = Field(default=None, description="Maximum price filter"),
+    category: Optional[str] = Field(default=None, description="Category filter")
+) -> List[List[EcommerceProduct]]:
     """
-    Get all available e-commerce products from the database.
+    Search for several tag lists at once with shared filters.
+    Returns one ranked product list per query, in query order.
     """
-    print(f"📦 MCP Tool called: get_all_ecommerce_products_list (limit: {limit})")
-    result = get_all_ecommerce_products(limit=limit)
-    print(f"   📋 Returned {len(result)} products")
+    print(f"🔍 MCP Tool called: search_ecommerce_products_by_tags_batch")
+    print(f"   Queries: {queries}")
+    
+    result = search_products_by_tags_batch(
+        queries=queries,
+        limit=limit,
+        min_price=min_price,
+        max_price=max_price,
+        category=category
+    )
+    
+    print(f"   🎯 Found {[len(products) for products in result]} products")
     return result
 
+@mcp.tool
+def get_all_ecommerce_products_list(
+    limit: int = Field(default=20, description="Maximum number of products to return"),
+    cursor: Optional[str] = Field(default=None, description="next_cursor from the previous page")
+) -> Dict[str, Any]:
+    """
+    Get available e-commerce products from the database, one page at a time.
+    Returns {"products": [...], "next_cursor": ...}; next_cursor is null on the last page.
+    Breaking change: this tool used to return a plain list of products. Read the list from
+    "products" and pass "next_cursor" back as `cursor` to fetch the next page.
+    """
+    print(f"📦 MCP Tool called: get_all_ecommerce_products_list (limit: {limit}, cursor: {cursor})")
+    products, next_cursor = get_ecommerce_products_page(limit=limit, cursor=cursor)
+    print(f"   📋 Returned {len(products)} products")
+    return {"products": products, "next_cursor": next_cursor}
+
 @mcp.tool
 def save_product_card(
     product_data: Dict[str, Any] = Field(description="Product card data to save")
@@ -97,6 +134,20 @@ def save_product_card(
     print(f"   ✅ Saved with ID: {product_id}")
     return product_id
 
+@mcp.tool
+def save_product_cards(
+    products: List[Dict[str, Any]] = Field(description="Product cards to save")
+) -> List[str]:
+    """
+    Save several product cards to the database in a single transaction.
+    Returns the generated product IDs in input order.
+    """
+    print(f"💾 MCP Tool called: save_product_cards ({len(products)} products)")
+    
+    product_ids = save_products_to_db(products)
+    print(f"   ✅ Saved {len(product_ids)} products")
+    return product_ids
+
 @mcp.tool
 def get_saved_products(
     limit: int = Field(default=10, description="Maximum number of products to return")
@@ -131,14 +182,13 @@ def get_database_stats() -> Dict[str, Any]:
     """Get database statistics and status."""
     print("📊 MCP Resource accessed: shopping://stats")
     try:
-        # Get some basic stats
-        saved_products = get_products_from_db(limit=1000)  # Get all to count
-        ecommerce_products = get_all_ecommerce_products(limit=1000)  # Get all to count
-        
+        # COUNT / GROUP BY queries (short TTL cache), no rows are loaded
         stats = {
             "status": "operational",
-            "saved_products_count": len(saved_products),
-            "ecommerce_products_count": len(ecommerce_products),
+            "saved_products_count": count_saved_products(),
+            "ecommerce_products_count": count_ecommerce_products(),
+            "ecommerce_products_total": count_ecommerce_products(in_stock_only=False),
+            "categories": get_category_stats(),
             "database_initialized": True
         }
         print(f"   📈 Stats: {stats}")
@@ -157,9 +207,7 @@ def get_available_categories() -> List[str]:
     """Get list of available product categories."""
     print("🏷️ MCP Resource accessed: shopping://categories")
     try:
-        ecommerce_products = get_all_ecommerce_products(limit=1000)
-        categories = list(set(product.category for product in ecommerce_products))
-        sorted_categories = sorted(categories)
+        sorted_categories = get_category_names()
         print(f"   📂 Found {len(sorted_categories)} categories: {sorted_categories}")
         return sorted_categories
     except Exception as e:
@@ -175,8 +223,10 @@ if __name__ == "__main__":
     print("="*60)
     print("\n📋 Available MCP Tools:")
     print("  🔍 search_ecommerce_products_by_tags - Search products by tags")
-    print("  📦 get_all_ecommerce_products_list - Get all e-commerce products")
+    print("  🔍 search_ecommerce_products_by_tags_batch - Search several tag lists at once")
+    print("  📦 get_all_ecommerce_products_list - Page through e-commerce products ({products, next_cursor})")
     print("  💾 save_product_card - Save a product card")
+    print("  💾 save_product_cards - Save several product cards in one transaction")
     print("  📚 get_saved_products - Get saved product cards")
     print("  🔎 search_products_by_description - Search by visual description")
     print("\n🗃️ Available MCP Resources:")
@@ -0,0 +1,46 @@
+"""
+Pytest ortamı: backend/ import yoluna eklenir, veritabanları geçici dizine yönlendirilir.
+Repo'daki app/data/*.db dosyalarına (app.routes import edilirken bile) dokunulmaz.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# No CSV watcher thread when app.routes starts the catalog sync
+os.environ.setdefault("CATALOG_SYNC_INTERVAL_SECONDS", "0")
+
+from app import database  # noqa: E402
+
+SOURCE_CSV_PATH = database.CSV_PATH
+
+# Import-time initialization (app.routes) goes to a throwaway directory
+_session_dir = Path(tempfile.mkdtemp(prefix="backend-tests-"))
+database.DB_PATH = _session_dir / "products.db"
+database.ECOMMERCE_DB_PATH = _session_dir / "ecommerce.db"
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_session_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def catalog_db(tmp_path, monkeypatch):
+    """Örnek CSV'nin kopyasıyla yüklenmiş geçici veritabanları; CSV kopyasının yolunu döndürür"""
+    csv_path = tmp_path / "ecommerce_products.csv"
+    shutil.copy(SOURCE_CSV_PATH, csv_path)
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "products.db")
+    monkeypatch.setattr(database, "ECOMMERCE_DB_PATH", tmp_path / "ecommerce.db")
+    monkeypatch.setattr(database, "CSV_PATH", csv_path)
+    monkeypatch.setattr(database, "_products_fts_exists", None)
+    database.invalidate_catalog_snapshot()
+    database.initialize_all_databases()
+    yield csv_path
+    database.invalidate_catalog_snapshot()
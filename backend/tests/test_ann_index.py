@@ -0,0 +1,42 @@
+import pytest
+
+from app import ann_index, database
+
+
+def test_candidates_start_with_the_query_buckets_and_respect_the_cap(catalog_db):
+    index = ann_index.get_ann_index(database.get_catalog_snapshot())
+    search_tags = ['kablosuz_kulaklik', 'gaming_kulaklik']
+
+    candidates = index.candidates(search_tags, probes=2, max_candidates=5)
+
+    assert 0 < len(candidates) <= 5
+    assert len(set(candidates.tolist())) == len(candidates)
+    # The first candidates come from the query's own bucket in table 0, not the lowest catalog positions
+    projections = index._projections(ann_index._vectorizer.transform([ann_index.query_text(search_tags)]))[0]
+    own_code = int(index._codes(projections)[0])
+    own_bucket = index.table_positions[0][index.table_codes[0] == own_code]
+    assert set(candidates[:min(len(own_bucket), 5)].tolist()) <= set(own_bucket.tolist())
+
+
+def test_index_is_cached_per_snapshot_and_shared_by_equal_catalogs(catalog_db, monkeypatch):
+    snapshot = database.get_catalog_snapshot()
+    index = ann_index.get_ann_index(snapshot)
+
+    # Same content in a new snapshot object: index reused, fingerprinted once, nothing written to disk
+    monkeypatch.setattr(ann_index, "save_ann_index", lambda *args, **kwargs: pytest.fail("rewrote the index"))
+    monkeypatch.setattr(ann_index, "catalog_text_fingerprint", _counting(ann_index.catalog_text_fingerprint))
+    other = database.refresh_catalog_snapshot()
+
+    assert ann_index.get_ann_index(other) is index
+    assert ann_index.get_ann_index(other) is index
+    assert ann_index.get_ann_index(snapshot) is index
+    assert ann_index.catalog_text_fingerprint.calls == 1
+
+
+def _counting(function):
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return function(*args, **kwargs)
+    wrapper.calls = 0
+    return wrapper
+
@@ -0,0 +1,29 @@
+import threading
+import time
+
+from app import autocomplete, database
+
+
+def test_previous_index_is_served_while_the_new_one_builds(catalog_db, monkeypatch):
+    first = autocomplete.get_autocomplete_index(database.get_catalog_snapshot())
+    started, release = threading.Event(), threading.Event()
+    build = autocomplete.build_autocomplete_index
+
+    def slow_build(snapshot):
+        started.set()
+        release.wait(5)
+        return build(snapshot)
+
+    monkeypatch.setattr(autocomplete, "build_autocomplete_index", slow_build)
+    database.invalidate_catalog_snapshot()
+
+    assert autocomplete.get_autocomplete_index() is first
+    assert started.wait(5)
+    assert autocomplete.get_autocomplete_index() is first
+
+    release.set()
+    deadline = time.time() + 5
+    while autocomplete.get_autocomplete_index() is first and time.time() < deadline:
+        time.sleep(0.01)
+    assert autocomplete.get_autocomplete_index() is not first
+    assert autocomplete.autocomplete('kulak')
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+
+import pytest
+
+from app import catalog_sync, database
+from app.catalog_sync import CatalogSync
+
+
+def _write(csv_path, lines, mtime):
+    csv_path.write_text(''.join(lines), encoding='utf-8')
+    os.utime(csv_path, (mtime, mtime))
+
+
+def _product_count():
+    return database.get_connection(database.ECOMMERCE_DB_PATH).execute(
+        'SELECT COUNT(*) FROM ecommerce_products'
+    ).fetchone()[0]
+
+
+@pytest.fixture
+def sync(catalog_db):
+    catalog_sync_ = CatalogSync(catalog_db, interval=0)
+    catalog_sync_.remember_current_file()
+    return catalog_sync_
+
+
+def test_unchanged_file_is_not_synced(sync):
+    os.utime(sync.csv_path, None)
+
+    assert sync.sync() is None
+
+
+def test_failed_sync_is_retried_until_it_succeeds(sync, monkeypatch):
+    original = sync.csv_path.read_text(encoding='utf-8').rstrip('\n') + '\n'
+    first_row = original.splitlines(keepends=True)[2]
+    new_row = first_row.replace(first_row.split(';', 1)[0], 'sync-test-product', 1)
+    _write(sync.csv_path, [original, new_row], mtime=2_000_000_000)
+    snapshot = database.get_catalog_snapshot()
+
+    upsert = catalog_sync.upsert_ecommerce_products_from_csv
+
+    def failing_upsert(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(catalog_sync, "upsert_ecommerce_products_from_csv", failing_upsert)
+    with pytest.raises(sqlite3.OperationalError):
+        sync.sync()
+
+    assert sync.status['last_error'] == "database is locked"
+    assert sync._changed_file() is not None  # still pending
+    assert database.get_catalog_snapshot() is not snapshot  # dropped, reloaded from SQLite
+
+    monkeypatch.setattr(catalog_sync, "upsert_ecommerce_products_from_csv", upsert)
+    stats = sync.sync()
+
+    assert stats['inserted'] == 1
+    assert sync.status['last_error'] is None
+    assert database.get_catalog_snapshot().get('sync-test-product') is not None
+    assert sync.sync() is None
+
+
+def test_truncated_csv_does_not_delete_the_catalog(sync):
+    original = sync.csv_path.read_text(encoding='utf-8')
+    lines = original.splitlines(keepends=True)
+    total = _product_count()
+    _write(sync.csv_path, lines[:12], mtime=2_000_000_000)
+
+    snapshot = database.get_catalog_snapshot()
+    with pytest.raises(ValueError, match="is the CSV truncated"):
+        sync.sync()
+
+    assert _product_count() == total
+    # Nothing was written, so the snapshot stays
+    assert database.get_catalog_snapshot() is snapshot
+    # The refused file is not re-read on the next polls, even after a touch
+    assert sync.sync() is None
+    os.utime(sync.csv_path, (2_000_000_050, 2_000_000_050))
+    assert sync.sync() is None
+    assert "is the CSV truncated" in sync.status['last_error']
+    # A forced reload still retries it
+    with pytest.raises(ValueError):
+        sync.sync(force=True)
+
+    _write(sync.csv_path, [original], mtime=2_000_000_100)
+    stats = sync.sync()
+
+    assert stats['deleted'] == 0
+    assert _product_count() == total
+    assert sync.sync() is None
+
+
+def test_removed_rows_are_deleted_within_the_ratio(sync):
+    lines = sync.csv_path.read_text(encoding='utf-8').splitlines(keepends=True)
+    removed_id = lines[-1].split(';', 1)[0]
+    total = _product_count()
+    _write(sync.csv_path, lines[:-1], mtime=2_000_000_000)
+
+    stats = sync.sync()
+
+    assert stats['deleted'] == 1
+    assert _product_count() == total - 1
+    assert database.get_catalog_snapshot().get(removed_id) is None
+
+
+def test_refused_csv_still_applies_its_updates(sync):
+    lines = sync.csv_path.read_text(encoding='utf-8').splitlines(keepends=True)
+    first_row = lines[2]
+    product_id = first_row.split(';', 1)[0]
+    updated_row = first_row.replace(';TL;', ';USD;', 1)
+    _write(sync.csv_path, lines[:2] + [updated_row], mtime=2_000_000_000)
+
+    with pytest.raises(ValueError):
+        sync.sync()
+
+    assert database.get_catalog_snapshot().get(product_id).currency == 'USD'
@@ -0,0 +1,35 @@
+import base64
+
+import pytest
+
+from app import database
+
+PNG_BASE64 = base64.b64encode(b'\x89PNG\r\n\x1a\n' + bytes(16)).decode('utf-8')
+
+
+def test_image_update_keeps_the_snapshot_and_shows_in_results(catalog_db):
+    snapshot = database.get_catalog_snapshot()
+    product = database.search_products_by_tags(['kablosuz_kulaklik'], limit=1)[0]
+
+    database.update_product_image_base64(product.id, PNG_BASE64, 'mavi kulaklık')
+
+    assert database.get_catalog_snapshot() is snapshot
+    updated = database.search_products_by_tags(['kablosuz_kulaklik'], limit=1)[0]
+    assert updated.id == product.id
+    assert updated.image_base64 == PNG_BASE64
+    assert updated.visual_representation == 'mavi kulaklık'
+    without_images = database.search_products_by_tags(['kablosuz_kulaklik'], limit=1, include_images=False)[0]
+    assert without_images.image_base64 is None
+    assert without_images.visual_representation == 'mavi kulaklık'
+
+
+def test_undecodable_image_does_not_clear_the_stored_one(catalog_db):
+    product = database.search_products_by_tags(['kablosuz_kulaklik'], limit=1)[0]
+    database.update_product_image_base64(product.id, PNG_BASE64, 'mavi kulaklık')
+
+    with pytest.raises(ValueError):
+        database.update_product_image_base64(product.id, 'not base64!', 'kırmızı kulaklık')
+
+    stored = database.search_products_by_tags(['kablosuz_kulaklik'], limit=1)[0]
+    assert stored.image_base64 == PNG_BASE64
+    assert stored.visual_representation == 'mavi kulaklık'
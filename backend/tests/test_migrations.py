@@ -0,0 +1,156 @@
+import base64
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app import database
+
+
+def _create_legacy_ecommerce_db(path, user_version, inline_images):
+    """Migration'lardan önceki şema: tek tablo, product_tags ve (v2 ise) satır içi görseller"""
+    conn = sqlite3.connect(path)
+    image_columns = 'image_base64 TEXT, visual_representation TEXT,' if inline_images else ''
+    conn.executescript(f'''
+        CREATE TABLE ecommerce_products (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            currency TEXT DEFAULT 'TL',
+            image_url TEXT,
+            tags TEXT,
+            category TEXT,
+            subcategory TEXT,
+            brand TEXT,
+            stock INTEGER DEFAULT 0,
+            rating REAL,
+            review_count INTEGER,
+            common_queries TEXT,
+            {image_columns}
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE product_tags (tag TEXT NOT NULL, product_id TEXT NOT NULL);
+        PRAGMA user_version = {user_version};
+    ''')
+    conn.execute('''
+        INSERT INTO ecommerce_products (id, name, description, price, tags, category, stock, rating,
+                                        review_count, common_queries)
+        VALUES ('p1', 'Kablosuz Kulaklık', 'Bluetooth kulaklık', 899.0, '["kablosuz_kulaklik"]',
+                'Elektronik', 3, 4.5, 12, '["kablosuz kulaklık", "bluetooth kulaklık"]')
+    ''')
+    conn.execute("INSERT INTO product_tags VALUES ('kablosuz_kulaklik', 'p1')")
+    conn.commit()
+    conn.close()
+
+
+def _schema_objects(path):
+    conn = sqlite3.connect(path)
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(ecommerce_products)')}
+        return version, tables, columns
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def legacy_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "products.db")
+    monkeypatch.setattr(database, "ECOMMERCE_DB_PATH", tmp_path / "ecommerce.db")
+    monkeypatch.setattr(database, "_products_fts_exists", None)
+    return tmp_path / "ecommerce.db"
+
+
+def test_unversioned_database_is_upgraded_to_the_latest_schema(legacy_paths):
+    _create_legacy_ecommerce_db(legacy_paths, user_version=0, inline_images=False)
+
+    database.migrate_databases()
+
+    version, tables, columns = _schema_objects(legacy_paths)
+    assert version == len(database.ECOMMERCE_MIGRATIONS)
+    assert 'product_tags' not in tables
+    assert 'idx_ecommerce_products_price' not in tables
+    assert {'image_blobs', 'category_queries', 'idx_ecommerce_products_listing'} <= tables
+    assert {'image_base64', 'visual_representation', 'image_hash', 'content_hash'} <= columns
+
+    conn = sqlite3.connect(legacy_paths)
+    content_hash = conn.execute("SELECT content_hash FROM ecommerce_products WHERE id = 'p1'").fetchone()[0]
+    queries = conn.execute("SELECT query, frequency FROM category_queries WHERE category = 'Elektronik'").fetchall()
+    conn.close()
+    assert content_hash
+    assert sorted(queries) == [('bluetooth kulaklık', 1), ('kablosuz kulaklık', 1)]
+
+    # Running again is a no-op
+    database.migrate_databases()
+    assert _schema_objects(legacy_paths)[0] == len(database.ECOMMERCE_MIGRATIONS)
+
+
+def test_inline_images_move_to_the_blob_store(legacy_paths):
+    _create_legacy_ecommerce_db(legacy_paths, user_version=2, inline_images=True)
+    image_base64 = base64.b64encode(b'\x89PNG\r\n\x1a\n' + bytes(16)).decode('utf-8')
+    conn = sqlite3.connect(legacy_paths)
+    conn.execute("UPDATE ecommerce_products SET image_base64 = ?, visual_representation = 'siyah' WHERE id = 'p1'",
+                 (image_base64,))
+    conn.commit()
+    conn.close()
+
+    database.migrate_databases()
+
+    conn = sqlite3.connect(legacy_paths)
+    inline, image_hash = conn.execute(
+        "SELECT image_base64, image_hash FROM ecommerce_products WHERE id = 'p1'"
+    ).fetchone()
+    conn.close()
+    assert inline is None
+    assert database._load_images_base64(legacy_paths, [image_hash]) == {image_hash: image_base64}
+
+
+def test_unused_price_index_is_dropped_from_existing_databases(legacy_paths):
+    _create_legacy_ecommerce_db(legacy_paths, user_version=0, inline_images=False)
+    database.migrate_databases()
+    conn = sqlite3.connect(legacy_paths)
+    conn.execute('CREATE INDEX idx_ecommerce_products_price ON ecommerce_products(price, stock, category)')
+    conn.execute('PRAGMA user_version = 7')
+    conn.commit()
+    conn.close()
+
+    database.migrate_databases()
+
+    version, tables, _ = _schema_objects(legacy_paths)
+    assert version == len(database.ECOMMERCE_MIGRATIONS)
+    assert 'idx_ecommerce_products_price' not in tables
+    assert 'idx_ecommerce_products_category_price' in tables
+
+
+def test_concurrent_upgrades_apply_each_step_once(tmp_path):
+    db_path = tmp_path / "race.db"
+    applied, errors, versions = [], [], []
+    barrier = threading.Barrier(2)
+
+    def create_table(cursor):
+        cursor.execute('CREATE TABLE items (id INTEGER PRIMARY KEY)')
+
+    def add_column(cursor):
+        applied.append(threading.get_ident())
+        time.sleep(0.2)  # hold the write lock while the other process starts
+        cursor.execute('ALTER TABLE items ADD COLUMN name TEXT')
+
+    def migrate():
+        barrier.wait()
+        try:
+            versions.append(database._apply_migrations(db_path, [create_table, add_column]))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=migrate) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert versions == [2, 2]
+    assert len(applied) == 1
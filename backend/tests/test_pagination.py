@@ -0,0 +1,71 @@
+import base64
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import database
+
+
+@pytest.fixture
+def client(catalog_db):
+    from app.routes import router
+
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def _listing_key(product):
+    return (product.rating or 0, product.review_count or 0, product.id)
+
+
+def test_cursor_walks_every_in_stock_product_once_in_listing_order(catalog_db):
+    products, cursor = database.get_ecommerce_products_page(limit=7)
+    while cursor:
+        page, cursor = database.get_ecommerce_products_page(limit=7, cursor=cursor)
+        assert page
+        products.extend(page)
+
+    snapshot = database.get_catalog_snapshot()
+    in_stock = {entry.id for entry in snapshot.entries if entry.stock > 0}
+    ids = [product.id for product in products]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == in_stock
+    keys = [_listing_key(product) for product in products]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_exact_page_boundary_ends_without_a_cursor(catalog_db):
+    total = len(database.get_ecommerce_products_page(limit=1000)[0])
+
+    products, cursor = database.get_ecommerce_products_page(limit=total)
+
+    assert len(products) == total
+    assert cursor is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "bad",
+    base64.urlsafe_b64encode(b"not json").decode("ascii"),
+    base64.urlsafe_b64encode(json.dumps([4.5, 10]).encode()).decode("ascii"),
+])
+def test_invalid_cursor_is_a_client_error(client, cursor):
+    response = client.get("/ecommerce_products", params={"cursor": cursor})
+
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.json()["detail"]
+
+
+def test_endpoint_returns_next_cursor(client):
+    first = client.get("/ecommerce_products", params={"limit": 5})
+    assert first.status_code == 200
+    body = first.json()
+    assert len(body["products"]) == 5
+    assert body["next_cursor"]
+
+    second = client.get("/ecommerce_products", params={"limit": 5, "cursor": body["next_cursor"]})
+    assert second.status_code == 200
+    first_ids = {product["id"] for product in body["products"]}
+    assert not first_ids & {product["id"] for product in second.json()["products"]}
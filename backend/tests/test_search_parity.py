@@ -0,0 +1,84 @@
+import pytest
+
+from app import database
+from app.catalog import build_catalog_snapshot
+from app.agent import cosine_similarity_search
+from app.catalog_shards import ShardedCatalog
+
+QUERIES = [
+    ['kablosuz_kulaklik'],
+    ['kablosuz_kulaklik', 'gaming_kulaklik'],
+    ['c_sehpa', 'modern_mobilya'],
+    ['siyah', 'minimalist', 'ahsap_masa'],
+    ['kulaklik_bluetooth', 'elektronik'],
+    ['spor_ayakkabi', 'kosu'],
+    ['bilinmeyen_etiket_xyz'],
+]
+
+
+def _ids(products):
+    return [product['id'] if isinstance(product, dict) else product.id for product in products]
+
+
+def test_batch_search_matches_single_query_scoring(catalog_db):
+    snapshot = database.get_catalog_snapshot()
+    product_data = [
+        {'id': entry.id, 'tags': list(entry.tags), 'rating': entry.rating, 'review_count': entry.review_count}
+        for entry in snapshot.entries if entry.stock > 0
+    ]
+
+    batch = database.search_products_by_tags_batch(QUERIES, limit=8, include_images=False)
+
+    for search_tags, results in zip(QUERIES, batch):
+        single = cosine_similarity_search(search_tags, product_data)[:8]
+        assert _ids(results) == _ids(single), search_tags
+        assert [product.similarity_score for product in results] == pytest.approx(
+            [product['similarity_score'] for product in single])
+
+
+def test_batch_results_do_not_depend_on_the_other_queries(catalog_db):
+    batch = database.search_products_by_tags_batch(QUERIES, limit=5, include_images=False)
+
+    for search_tags, results in zip(QUERIES, batch):
+        alone = database.search_products_by_tags_batch([search_tags], limit=5, include_images=False)[0]
+        assert _ids(results) == _ids(alone)
+
+
+@pytest.fixture
+def sharded(catalog_db):
+    catalog = ShardedCatalog(2)
+    # A worker failure falls back to the in-process search, which would make the comparison vacuous
+    catalog.reset = lambda: pytest.fail("sharded search fell back to the in-process snapshot")
+    yield catalog
+    ShardedCatalog.reset(catalog)
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {'category': 'Elektronik'},
+    {'min_price': 100, 'max_price': 1000},
+    {'categories': ['Mobilya', 'Elektronik']},
+    {'diversity_seed': 7},
+])
+def test_sharded_search_matches_single_snapshot(sharded, filters):
+    snapshot = database.get_catalog_snapshot()
+    sharded_snapshot = sharded.for_snapshot(snapshot)
+    assert len(sharded_snapshot.plan) == 2
+
+    for search_tags in QUERIES:
+        for limit in (1, 4, 10):
+            expected = snapshot.search_by_tags(search_tags, limit=limit, **filters)
+            assert _ids(sharded_snapshot.search_by_tags(search_tags, limit=limit, **filters)) == _ids(expected), \
+                (search_tags, limit)
+
+
+def test_diversity_seed_ranking_does_not_depend_on_row_order(catalog_db):
+    snapshot = database.get_catalog_snapshot()
+    reordered = build_catalog_snapshot(list(reversed(database._load_catalog_rows())))
+
+    for search_tags in QUERIES:
+        for seed in (0, 7, 2**40):
+            expected = snapshot.search_by_tags(search_tags, limit=10, diversity_seed=seed)
+            assert _ids(reordered.search_by_tags(search_tags, limit=10, diversity_seed=seed)) == _ids(expected)
+    seeded = [_ids(snapshot.search_by_tags(['bluetooth_kulaklik'], limit=3, diversity_seed=seed)) for seed in range(5)]
+    assert len({tuple(ids) for ids in seeded}) > 1
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app import database
+from app.agent import cosine_similarity_search
+from app.catalog import TAG_VOCABULARY
+from app.tag_vectors import tag_match_scores
+
+
+def baseline_cosine_similarity_search(search_tags, product_data, min_threshold=0.1):
+    """Eski cosine_similarity_search: sorgu + ürünler üzerinde fit edilen TF-IDF, birebir eşleşme başına %30"""
+    product_tags = [product['tags'] for product in product_data]
+    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 8), lowercase=True,
+                                 max_features=10000, min_df=1)
+    matrix = vectorizer.fit_transform([' '.join(search_tags)] + [' '.join(tags) for tags in product_tags])
+    similarities = cosine_similarity(matrix[0], matrix[1:]).flatten()
+
+    results = []
+    for product, tags, score in zip(product_data, product_tags, similarities):
+        exact_matches = set(search_tags) & set(tags)
+        if exact_matches:
+            score *= 1.0 + len(exact_matches) * 0.3
+        if score > min_threshold:
+            results.append({**product, 'similarity_score': float(score)})
+    results.sort(key=lambda product: product['similarity_score'], reverse=True)
+    return results
+
+
+def catalog_product_data():
+    snapshot = database.get_catalog_snapshot()
+    return [{'id': entry.id, 'name': entry.name, 'tags': list(entry.tags)}
+            for entry in snapshot.entries if entry.stock > 0]
+
+
+def test_near_miss_products_still_rank_like_the_baseline(catalog_db):
+    # Both tags exist in the catalog; products carrying neither must still get a similarity score
+    search_tags = ['kablosuz_kulaklik', 'gaming_kulaklik']
+    product_data = catalog_product_data()
+
+    baseline = baseline_cosine_similarity_search(search_tags, product_data)
+    results = cosine_similarity_search(search_tags, product_data)
+
+    baseline_ids = [product['id'] for product in baseline]
+    result_ids = [product['id'] for product in results]
+    assert len(baseline_ids) > 10
+    assert len(result_ids) >= 0.8 * len(baseline_ids)
+    assert len(set(result_ids) & set(baseline_ids)) >= 0.8 * len(baseline_ids)
+    assert set(result_ids[:5]) == set(baseline_ids[:5])
+    # Not collapsed onto a single tied score
+    assert len({round(product['similarity_score'], 6) for product in results}) > 5
+
+
+def test_product_without_exact_match_scores_whole_query_similarity(catalog_db):
+    snapshot = database.get_catalog_snapshot()
+    product = {'id': 'not-in-catalog', 'tags': ['gaming_kulaklik_rgb']}
+
+    scores = tag_match_scores(['gaming_kulaklik', 'kablosuz_kulaklik'], [product], snapshot)
+
+    assert 0.0 < scores[0] < 1.0
+
+
+def test_leftovers_are_decided_per_product(catalog_db):
+    snapshot = database.get_catalog_snapshot()
+    search_tags = ['kablosuz_kulaklik', 'gaming_kulaklik']
+    both = {'id': 'a', 'tags': json.dumps(['gaming_kulaklik', 'kablosuz_kulaklik'])}
+    one = {'id': 'b', 'tags': ['kablosuz_kulaklik', 'oyuncu']}
+
+    scores = tag_match_scores(search_tags, [both, one], snapshot)
+
+    # Full match: (2 / 2) * (1 + 0.3 * 2); partial match gets fuzzy credit for the missing tag only
+    assert scores[0] == pytest.approx(1.6)
+    assert 0.5 * 1.3 < scores[1] < 1.3
+
+
+def test_tag_spelling_variants_match_exactly(catalog_db):
+    snapshot = database.get_catalog_snapshot()
+    product = {'id': 'x', 'tags': ['Kablosuz_Kulaklık']}
+
+    scores = tag_match_scores(['kulaklik_kablosuz'], [product], snapshot)
+
+    assert scores[0] == pytest.approx(1.3)
+
+
+def test_tag_known_only_to_the_vocabulary_is_still_a_leftover(catalog_db):
+    # TAG_VOCABULARY only grows: a tag removed from the catalog stays interned
+    TAG_VOCABULARY.intern('gaming_kulaklik_pro')
+
+    results = database.search_products_by_tags_batch([['gaming_kulaklik_pro']], limit=5, include_images=False)[0]
+
+    assert results
+    assert all('kulaklik' in ' '.join(product.tags).lower().replace('ı', 'i') for product in results)